@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import tarfile
+import zipfile
+import zlib
+from itertools import islice
+
+import numpy as np
+
+CLASS_NAMES = ["Benign", "Malignant"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def format_prediction(prediction):
+    """Turns one softmax row into the API's {predicted_class, probability} pair."""
+    benign_prob, malignant_prob = float(prediction[0]), float(prediction[1])
+    predicted_class = "Malignant" if malignant_prob > benign_prob else "Benign"
+    probability = round(max(benign_prob, malignant_prob), 4)
+    return predicted_class, probability
+
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")
+
+
+class ArchiveTooLarge(ValueError):
+    """Raised when an archive has more images, or larger ones, than the limits allow."""
+
+
+class CorruptArchive(ValueError):
+    """Raised when an archive cannot be read, up front or part-way through."""
+
+
+# What zipfile, tarfile and their decompressors raise on truncated or corrupt data
+ARCHIVE_READ_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+class ArchiveLimits:
+    """
+    Caps checked against the sizes recorded in the archive before a member
+    is read; zipfile and tarfile never return more bytes than recorded, so a
+    compression bomb cannot get past them.
+    """
+
+    def __init__(self, max_members=10000, max_member_bytes=16 * 1024 * 1024, max_total_bytes=4 * 1024 ** 3):
+        self.max_members = max_members
+        self.max_member_bytes = max_member_bytes
+        self.max_total_bytes = max_total_bytes
+        self.members = 0
+        self.total_bytes = 0
+
+    def admit(self, name, size):
+        self.members += 1
+        self.total_bytes += size
+        if self.members > self.max_members:
+            raise ArchiveTooLarge(f"Archive has more than {self.max_members} images")
+        if size > self.max_member_bytes:
+            raise ArchiveTooLarge(f"{name} is {size} bytes uncompressed, over the {self.max_member_bytes} byte limit")
+        if self.total_bytes > self.max_total_bytes:
+            raise ArchiveTooLarge(f"Archive holds more than {self.max_total_bytes} bytes of images")
+
+
+def _zip_images(archive):
+    return [info for info in archive.infolist() if not info.is_dir() and is_image_name(info.filename)]
+
+
+def check_archive(fileobj, filename, limits):
+    """
+    Checks a ZIP's index against `limits` up front, so the request can be
+    refused before streaming starts. Tar archives have no index; only their
+    first header is read here, and limits are checked member by member in
+    `iter_archive`. Raises `CorruptArchive` if the file is not an archive.
+    """
+    if filename.lower().endswith(".zip"):
+        try:
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in _zip_images(archive):
+                    limits.admit(info.filename, info.file_size)
+        except zipfile.BadZipFile as e:
+            raise CorruptArchive(f"Not a valid ZIP archive: {e}")
+    else:
+        try:
+            with tarfile.open(fileobj=fileobj, mode="r|*"):
+                pass
+        except ARCHIVE_READ_ERRORS as e:
+            raise CorruptArchive(f"Not a valid tar archive: {e}")
+    fileobj.seek(0)
+
+
+def iter_archive(fileobj, filename, limits=None):
+    """
+    Yields (member name, bytes) for every image inside a ZIP or tar archive.
+
+    Tar archives (optionally gzip/bz2/xz compressed) are read as a stream, one
+    member at a time; ZIP needs a seekable file because its index is at the end.
+    Raises `ArchiveTooLarge` before reading a member that breaks `limits`,
+    and `CorruptArchive` when the data turns out to be truncated or corrupt.
+    """
+    limits = limits or ArchiveLimits()
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in _zip_images(archive):
+                    limits.admit(info.filename, info.file_size)
+                    yield info.filename, archive.read(info)
+        else:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+                for member in archive:
+                    if member.isfile() and is_image_name(member.name):
+                        limits.admit(member.name, member.size)
+                        yield member.name, archive.extractfile(member).read()
+    except ARCHIVE_READ_ERRORS as e:
+        raise CorruptArchive(f"Archive is corrupt: {e}")
+
+
+async def predict_stream(items, pool, predict_fn, img_size, batch_size=32, on_result=None):
+    """
+    Runs (name, bytes) items through decode and inference in fixed-size batches.
+
+    Yields one NDJSON line per image as soon as its batch is done, then a final
+    summary line. Decoding of the next batch overlaps with inference on the
+    current one. `items` is a plain iterator and is advanced in a thread, since
+    reading archive members is blocking I/O. `on_result` is called with every
+    successful result, e.g. to log it. Items whose name is not a JPEG/PNG
+    get an error line instead of being decoded. If the archive breaks its
+    limits or turns out to be corrupt part-way, an {"error": ...} line is
+    written and the stream ends with the summary.
+    """
+    loop = asyncio.get_running_loop()
+    items = iter(items)
+
+    deferred = []
+
+    async def unsupported():
+        raise ValueError(f"Unsupported file type; send {', '.join(IMAGE_EXTENSIONS)} images")
+
+    def take():
+        # Images read before an archive limit or corrupt member was hit are still scored
+        chunk = []
+        try:
+            for item in islice(items, batch_size):
+                chunk.append(item)
+        except (ArchiveTooLarge, CorruptArchive) as e:
+            if not chunk:
+                raise
+            deferred.append(e)
+        return chunk
+
+    async def next_chunk():
+        if deferred:
+            raise deferred.pop()
+        chunk = await asyncio.to_thread(take)
+        if not chunk:
+            return None
+        names = [name for name, _ in chunk]
+        decoded = await asyncio.gather(
+            *(pool.decode(contents, img_size) if is_image_name(name) else unsupported()
+              for name, contents in chunk),
+            return_exceptions=True,
+        )
+        return names, decoded
+
+    count = errors = 0
+    pending = asyncio.ensure_future(next_chunk())
+    try:
+        while True:
+            try:
+                chunk = await pending
+            except (ArchiveTooLarge, CorruptArchive) as e:
+                errors += 1
+                yield json.dumps({"error": str(e)}) + "\n"
+                break
+            if chunk is None:
+                break
+            pending = asyncio.ensure_future(next_chunk())
+
+            names, decoded = chunk
+            valid = [i for i, image in enumerate(decoded) if not isinstance(image, BaseException)]
+            predictions = {}
+            if valid:
+                images = np.stack([decoded[i] for i in valid])
+                rows = await loop.run_in_executor(pool.inference_executor, predict_fn, images)
+                predictions = dict(zip(valid, rows))
+
+            for i, name in enumerate(names):
+                count += 1
+                if i in predictions:
+                    predicted_class, probability = format_prediction(predictions[i])
+                    result = {"filename": name, "predicted_class": predicted_class, "probability": probability}
+                    if on_result is not None:
+                        on_result(result)
+                else:
+                    errors += 1
+                    result = {"filename": name, "error": str(decoded[i])}
+                yield json.dumps(result) + "\n"
+    finally:
+        pending.cancel()
+
+    yield json.dumps({"summary": {"count": count, "errors": errors}}) + "\n"
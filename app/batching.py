@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+
+class LatencyStats:
+    """Keeps a sliding window of request latencies and a batch-size histogram."""
+
+    def __init__(self, window=2048):
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batch_sizes[size] += 1
+
+    def record_latency(self, latency_ms):
+        self.requests += 1
+        self.latencies_ms.append(latency_ms)
+
+    def percentile(self, q):
+        if not self.latencies_ms:
+            return None
+        return round(float(np.percentile(np.fromiter(self.latencies_ms, dtype=np.float64), q)), 3)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 3) if self.batches else None,
+            "batch_size_counts": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "latency_p50_ms": self.percentile(50),
+            "latency_p99_ms": self.percentile(99),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-image requests into one forward pass.
+
+    A batch is flushed as soon as it reaches `max_batch_size`, or `max_wait_ms`
+    after its first request arrived, whichever comes first. `predict_fn` receives
+    a stacked (N, H, W, C) array and must return an (N, num_classes) array.
+
+    The forward pass runs on `executor` (the default thread pool if None) so the
+    event loop stays responsive. With `workers > 1`, that many batches can be in
+    flight at the same time, which only helps if the executor has as many threads.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, executor=None, workers=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.workers = workers
+        self.stats = LatencyStats()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def submit(self, image_array):
+        """Queue one preprocessed (H, W, C) image and wait for its prediction row."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        # Block for the first item, then keep filling until the batch is full or the wait expires
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            images = np.stack([item[0] for item in batch])
+            self.stats.record_batch(len(batch))
+
+            try:
+                loop = asyncio.get_running_loop()
+                predictions = await loop.run_in_executor(self.executor, self.predict_fn, images)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, enqueued), row in zip(batch, predictions):
+                self.stats.record_latency((done - enqueued) * 1000.0)
+                # The caller may have disconnected while we were predicting
+                if not future.done():
+                    future.set_result(row)
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def model_file_version(path):
+    """Cheap version tag for a model file, derived from its size and mtime."""
+    stat = os.stat(path)
+    return hashlib.sha256(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+
+
+def content_digest(contents):
+    return hashlib.sha256(contents).hexdigest()
+
+
+class PredictionCache:
+    """
+    Content-addressed LRU cache of prediction rows.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes plus the version
+    of the model that produced them, so a retrained or A/B-routed model never
+    serves another model's results. The in-memory
+    tier holds at most `max_entries` rows for `ttl_seconds`; when `disk_path`
+    is set, entries are also written to a SQLite file that survives restarts
+    and is consulted on a memory miss.
+
+    SQLite is only touched from worker threads. New entries are queued and
+    written in one transaction every `flush_interval` seconds by a background
+    task, which also deletes expired rows and the oldest rows beyond
+    `max_disk_entries` every `prune_interval` seconds.
+    """
+
+    def __init__(self, model_version, max_entries=10000, ttl_seconds=24 * 3600, disk_path=None,
+                 max_disk_entries=100000, flush_interval=2.0, prune_interval=300.0):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._unwritten = {}
+        self._task = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_predictions_expires ON predictions (expires)")
+            self._prune()
+
+    def key(self, contents, model_version=None):
+        return self.key_for_digest(content_digest(contents), model_version)
+
+    def key_for_digest(self, digest, model_version=None):
+        return f"{model_version or self.model_version}:{digest}"
+
+    async def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self._db is not None:
+            row = self._unwritten.get(key)
+            if row is None:
+                row = await asyncio.to_thread(self._read, key)
+            if row is not None and row[1] >= now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, value, row[1])
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        value = [float(v) for v in value]
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                self._unwritten[key] = (json.dumps(value), expires)
+
+    def _remember(self, key, value, expires):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read(self, key):
+        with self._db_lock:
+            return self._db.execute("SELECT value, expires FROM predictions WHERE key = ?", (key,)).fetchone()
+
+    def _write(self, rows):
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO predictions (key, value, expires) VALUES (?, ?, ?)",
+                [(key, value, expires) for key, (value, expires) in rows.items()],
+            )
+            self._db.execute("COMMIT")
+
+    def _prune(self):
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM predictions WHERE expires < ?", (time.time(),)).rowcount
+            # Every row lives for the same TTL, so the earliest expiry is the oldest write
+            deleted += self._db.execute(
+                "DELETE FROM predictions WHERE key IN ("
+                "SELECT key FROM predictions ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            ).rowcount
+        self.pruned += deleted
+
+    async def flush(self):
+        rows, self._unwritten = self._unwritten, {}
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    async def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - last_prune >= self.prune_interval:
+                await asyncio.to_thread(self._prune)
+                last_prune = time.monotonic()
+
+    async def start(self):
+        if self._db is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "unwritten": len(self._unwritten),
+            "pruned": self.pruned,
+        }
@@ -1,49 +1,588 @@
-from fastapi import FastAPI, UploadFile, File
-from tensorflow.keras.models import load_model
+from contextlib import ExitStack, asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+
 from PIL import Image
-import numpy as np
-from io import BytesIO
-from datetime import datetime
-from typing import List
+from pydantic import BaseModel, Field
 
-session_logs: List[dict] = []
+from batch_predict import (
+    ArchiveLimits, ArchiveTooLarge, check_archive, format_prediction, is_image_name, iter_archive, predict_stream,
+)
+from cache import PredictionCache, content_digest, model_file_version
+from metrics import (
+    ERRORS, MODEL_LOAD_SECONDS, PREDICTIONS, REQUEST_SECONDS, REQUESTS, observe_stages, render, route_path, stage,
+)
+from model_loader import ModelHolder, ModelNotReady
+from prediction_log import PredictionLog
+from profiling import ProfilerUnavailable, run_cprofile, run_pyspy
+from registry import ModelRegistry, RegistryConflict, UnknownModel
+from similarity import EMBEDDER, META, SimilarityIndex
+from tiling import SlideTooLarge, open_tile_source, score_tiles
+from uncertainty import describe as describe_uncertainty, summarize
+from workers import DecodeUnavailable, Overloaded, WorkerPool
 
-app = FastAPI()
+MODEL_PATH = os.getenv("MODEL_PATH", "model/model.keras")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "auto")  # auto, keras, savedmodel, tflite or onnx
+MODEL_VERSION = os.getenv("MODEL_VERSION") or model_file_version(MODEL_PATH)
 
-model = load_model("model/model.keras")
 IMG_SIZE = 128
 
+# TensorFlow is imported and the model loaded in a background task, so the
+# server binds immediately; "blocking" waits for the model before serving
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "60"))
+
+# /predict?uncertainty=true: flip/rotation views (TTA, up to 8) times dropout
+# samples of the head; abstains when the malignant probability's std is higher
+# or its mean is close to 0.5
+UNCERTAINTY_TTA = int(os.getenv("UNCERTAINTY_TTA", "8"))
+UNCERTAINTY_MC_SAMPLES = int(os.getenv("UNCERTAINTY_MC_SAMPLES", "16"))
+UNCERTAINTY_ABSTAIN_STD = float(os.getenv("UNCERTAINTY_ABSTAIN_STD", "0.1"))
+UNCERTAINTY_ABSTAIN_MARGIN = float(os.getenv("UNCERTAINTY_ABSTAIN_MARGIN", "0.05"))
+
+# Model registry: an optional candidate next to the primary model, which takes
+# CANDIDATE_TRAFFIC_PERCENT of /predict traffic ("ab") or is only compared
+# with the primary off the request path ("shadow")
+CANDIDATE_MODEL_PATH = os.getenv("CANDIDATE_MODEL_PATH")
+CANDIDATE_MODEL_VERSION = os.getenv("CANDIDATE_MODEL_VERSION")
+CANDIDATE_MODE = os.getenv("CANDIDATE_MODE", "ab")
+CANDIDATE_TRAFFIC_PERCENT = float(os.getenv("CANDIDATE_TRAFFIC_PERCENT", "0"))
+MODEL_MEMORY_LIMIT_MB = float(os.getenv("MODEL_MEMORY_LIMIT_MB", "0"))  # 0: no limit
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "900"))
+
+# /models admin endpoints (register, promote, route, unload); off unless enabled
+MODEL_ADMIN_ENABLED = os.getenv("MODEL_ADMIN_ENABLED", "false").lower() in ("1", "true")
+
+# Dynamic batching: concurrent requests are grouped into one forward pass
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "16"))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "5"))
+
+# Worker pools for the CPU-bound stages, so the event loop never runs them
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "2"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", "64"))
+# Uploads with more pixels are refused (413) from their header, before a worker decodes them
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", "50000000"))
+
+# /predict/batch runs inference in fixed-size chunks of this many images
+BATCH_PREDICT_SIZE = int(os.getenv("BATCH_PREDICT_SIZE", "32"))
+# Limits for archives sent to /predict/batch, checked before anything is extracted
+ARCHIVE_MAX_IMAGES = int(os.getenv("ARCHIVE_MAX_IMAGES", "10000"))
+ARCHIVE_MAX_IMAGE_MB = float(os.getenv("ARCHIVE_MAX_IMAGE_MB", "16"))
+ARCHIVE_MAX_TOTAL_MB = float(os.getenv("ARCHIVE_MAX_TOTAL_MB", "4096"))
+
+# /predict/tiled scores large images as overlapping IMG_SIZE tiles
+TILE_STRIDE = int(os.getenv("TILE_STRIDE", "64"))
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "64"))
+TILED_MAX_PIXELS = int(os.getenv("TILED_MAX_PIXELS", "150000000"))  # PIL fallback only
+
+# /similar: index and embedding model written by scripts/build_embedding_index.py
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "model/similarity_index")
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "16"))
+
+# /debug/profile runs cProfile or py-spy on the live server; off unless enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true")
+
+# Repeat uploads of the same image are answered from the cache without decoding
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", str(24 * 3600)))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH")  # e.g. cache/predictions.sqlite
+PREDICTION_CACHE_DISK_SIZE = int(os.getenv("PREDICTION_CACHE_DISK_SIZE", "100000"))
+
+# Prediction log: a fixed-size ring buffer flushed in batches to SQLite
+PREDICTION_LOG_PATH = os.getenv("PREDICTION_LOG_PATH", "logs/predictions.sqlite")
+PREDICTION_LOG_CAPACITY = int(os.getenv("PREDICTION_LOG_CAPACITY", "4096"))
+PREDICTION_LOG_FLUSH_SECONDS = float(os.getenv("PREDICTION_LOG_FLUSH_SECONDS", "2"))
+# Retention; Cloud Run's filesystem lives in memory unless a volume is mounted. 0 disables a limit
+PREDICTION_LOG_MAX_ROWS = int(os.getenv("PREDICTION_LOG_MAX_ROWS", "1000000"))
+PREDICTION_LOG_MAX_AGE_DAYS = float(os.getenv("PREDICTION_LOG_MAX_AGE_DAYS", "30"))
+
+
+if os.path.exists(os.path.join(SIMILARITY_INDEX_PATH, META)):
+    similarity_index = SimilarityIndex(SIMILARITY_INDEX_PATH, nprobe=SIMILARITY_NPROBE)
+    embedder = ModelHolder(os.path.join(SIMILARITY_INDEX_PATH, EMBEDDER), IMG_SIZE)
+else:
+    similarity_index = embedder = None
+
+
+cache = PredictionCache(
+    MODEL_VERSION,
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=PREDICTION_CACHE_TTL,
+    disk_path=PREDICTION_CACHE_PATH,
+    max_disk_entries=PREDICTION_CACHE_DISK_SIZE,
+)
+prediction_log = PredictionLog(
+    PREDICTION_LOG_PATH,
+    capacity=PREDICTION_LOG_CAPACITY,
+    flush_interval=PREDICTION_LOG_FLUSH_SECONDS,
+    max_rows=PREDICTION_LOG_MAX_ROWS or None,
+    max_age_seconds=PREDICTION_LOG_MAX_AGE_DAYS * 86400 or None,
+)
+pool = WorkerPool(
+    decode_workers=DECODE_WORKERS,
+    inference_workers=INFERENCE_WORKERS,
+    max_pending=MAX_PENDING_REQUESTS,
+    max_pixels=DECODE_MAX_PIXELS,
+)
+registry = ModelRegistry(
+    IMG_SIZE,
+    batch_options={
+        "max_batch_size": MAX_BATCH_SIZE,
+        "max_wait_ms": MAX_BATCH_WAIT_MS,
+        "executor": pool.inference_executor,
+        "workers": INFERENCE_WORKERS,
+    },
+    uncertainty_options={"tta": UNCERTAINTY_TTA, "mc_samples": UNCERTAINTY_MC_SAMPLES},
+    memory_limit_bytes=MODEL_MEMORY_LIMIT_MB * 1024 * 1024 or None,
+    idle_seconds=MODEL_IDLE_SECONDS or None,
+)
+registry.register(MODEL_VERSION, MODEL_PATH, backend=MODEL_BACKEND, primary=True)
+if CANDIDATE_MODEL_PATH:
+    registry.register(
+        CANDIDATE_MODEL_VERSION or model_file_version(CANDIDATE_MODEL_PATH), CANDIDATE_MODEL_PATH,
+        backend=MODEL_BACKEND,
+    )
+
+MODEL_LOAD_SECONDS.labels("load").set_function(
+    lambda: registry.primary.holder.timings.get("load_seconds", float("nan")))
+MODEL_LOAD_SECONDS.labels("warmup").set_function(
+    lambda: registry.primary.holder.timings.get("warmup_seconds", float("nan")))
+
+
+async def start_candidate(version):
+    # Routing only switches once the candidate is loaded and warmed up
+    try:
+        await registry.set_candidate(
+            version, percent=CANDIDATE_TRAFFIC_PERCENT, shadow=CANDIDATE_MODE == "shadow")
+    except RegistryConflict:
+        pass  # load error, reported by /models
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await prediction_log.start()
+    await cache.start()
+    await registry.start()
+    if MODEL_LOAD_MODE == "blocking":
+        primary = await registry.load(MODEL_VERSION)
+        if primary.holder.error is not None:
+            raise primary.holder.error
+        load_task = None
+    else:
+        load_task = asyncio.create_task(registry.load(MODEL_VERSION))
+    candidate_versions = [version for version in registry.models if version != MODEL_VERSION]
+    candidate_task = asyncio.create_task(start_candidate(candidate_versions[0])) if candidate_versions else None
+    embed_task = asyncio.create_task(embedder.load_async()) if embedder is not None else None
+    yield
+    for task in (load_task, candidate_task, embed_task):
+        if task is not None:
+            task.cancel()
+    await registry.stop()
+    pool.shutdown()
+    await cache.stop()
+    await prediction_log.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        path = route_path(request)
+        REQUESTS.labels(request.method, path, str(status)).inc()
+        REQUEST_SECONDS.labels(request.method, path).observe(time.perf_counter() - start)
+
+@app.exception_handler(Exception)
+async def unexpected_error_handler(request, exc):
+    ERRORS.labels(route_path(request), type(exc).__name__).inc()
+    return JSONResponse(status_code=500, content={"error": str(exc)})
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc):
+    ERRORS.labels(route_path(request), "overloaded").inc()
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(DecodeUnavailable)
+async def decode_unavailable_handler(request, exc):
+    ERRORS.labels(route_path(request), "decode_worker_died").inc()
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(UnknownModel)
+async def unknown_model_handler(request, exc):
+    return JSONResponse(status_code=404, content={"error": str(exc)})
+
+@app.exception_handler(RegistryConflict)
+async def registry_conflict_handler(request, exc):
+    return JSONResponse(status_code=409, content={"error": str(exc)})
+
+@app.exception_handler(ModelNotReady)
+async def not_ready_handler(request, exc):
+    ERRORS.labels(route_path(request), "model_not_ready").inc()
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(exc)},
+        headers={"Retry-After": "5"},
+    )
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the Breast Cancer Prediction API!"}
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up, whether or not the model is loaded yet
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    holder = registry.primary.holder
+    if not holder.ready:
+        status = "failed" if holder.error is not None else "loading"
+        content = {"status": status}
+        if holder.error is not None:
+            content["error"] = str(holder.error)
+        return JSONResponse(status_code=503, content=content)
+    return {
+        "status": "ready",
+        "model_version": registry.primary_version,
+        "backend": type(holder.model).__name__,
+        **holder.timings,
+    }
+
+@app.get("/stats")
+def stats():
+    batcher = registry.primary.batcher
+    return {
+        "max_batch_size": batcher.max_batch_size,
+        "max_batch_wait_ms": batcher.max_wait * 1000.0,
+        "pending_requests": pool.pending,
+        "decode_worker_restarts": pool.decode_restarts,
+        "max_pending_requests": pool.max_pending,
+        **batcher.stats.snapshot(),
+        "cache": cache.stats(),
+        "prediction_log": prediction_log.stats(),
+    }
+
+def to_epoch(value):
+    # Timestamps without an offset are taken as UTC, like the ones we return
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+@app.get("/logs")
+async def logs(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    predicted_class: Optional[Literal["Benign", "Malignant"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Past predictions, newest first, filtered by time range and class."""
     try:
-        contents = await file.read()
-        image = Image.open(BytesIO(contents)).convert("RGB")
-        image = image.resize((IMG_SIZE, IMG_SIZE))
-        image_array = np.array(image) / 255.0
-        image_array = np.expand_dims(image_array, axis=0)
+        return await prediction_log.query(
+            start=to_epoch(start),
+            end=to_epoch(end),
+            predicted_class=predicted_class,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor!r}; pass next_cursor from the last page")
 
-        prediction = model.predict(image_array)
-        benign_prob, malignant_prob = float(prediction[0][0]), float(prediction[0][1])
+@app.get("/metrics")
+def metrics():
+    body, content_type = render()
+    return Response(body, media_type=content_type)
 
-        predicted_class = "Malignant" if malignant_prob > benign_prob else "Benign"
-        probability = round(max(benign_prob, malignant_prob), 4)
+profile_lock = asyncio.Lock()
 
-        # Store in session log
-        session_logs.append({
-            "filename": file.filename,
-            "predicted_class": predicted_class,
-            "probability": probability,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+@app.get("/debug/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, le=120),
+    mode: Literal["cprofile", "py-spy"] = "cprofile",
+):
+    """Profiles the live server for `seconds` while it keeps serving traffic."""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILING_ENABLED=true")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with profile_lock:
+        try:
+            if mode == "cprofile":
+                return PlainTextResponse(await run_cprofile(seconds))
+            return Response(await run_pyspy(seconds), media_type="application/json")
+        except ProfilerUnavailable as e:
+            raise HTTPException(status_code=501, detail=str(e))
+
+class ModelRegistration(BaseModel):
+    path: str
+    version: Optional[str] = None  # default: derived from the artifact, like MODEL_VERSION
+    backend: Literal["auto", "keras", "savedmodel", "tflite", "onnx"] = "auto"
+    load: bool = True
+
+class RoutingUpdate(BaseModel):
+    candidate: Optional[str] = None  # None stops routing to a candidate
+    percent: float = Field(0.0, ge=0.0, le=100.0)
+    mode: Literal["ab", "shadow"] = "ab"
+
+def require_model_admin():
+    if not MODEL_ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Model admin is disabled; set MODEL_ADMIN_ENABLED=true")
+
+@app.get("/models")
+def models():
+    """Registered versions, which one serves traffic, and the shadow disagreement rates."""
+    return registry.describe()
+
+@app.post("/models", status_code=201)
+async def register_model(registration: ModelRegistration):
+    """Adds a model version, e.g. a new artifact from scripts/train_model.py, and warms it up."""
+    require_model_admin()
+    try:
+        version = registration.version or model_file_version(registration.path)
+        entry = registry.register(version, registration.path, backend=registration.backend)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if registration.load:
+        await registry.load(version)
+    return entry.describe()
+
+@app.post("/models/{version}/promote")
+async def promote_model(version: str):
+    """Makes `version` the primary. It is loaded first; in-flight requests finish on the old one."""
+    require_model_admin()
+    previous = await registry.promote(version)
+    return {"primary": version, "previous": previous}
+
+@app.put("/models/routing")
+async def route_models(update: RoutingUpdate):
+    """Sends `percent` of /predict traffic to `candidate` ("ab"), or shadows all of it ("shadow")."""
+    require_model_admin()
+    await registry.set_candidate(update.candidate, percent=update.percent, shadow=update.mode == "shadow")
+    return registry.describe()
+
+@app.delete("/models/{version}")
+async def remove_model(version: str):
+    require_model_admin()
+    await registry.unload(version, remove=True)
+    return {"removed": version}
+
+def log_prediction(result):
+    PREDICTIONS.labels(result["predicted_class"]).inc()
+    prediction_log.append(result["filename"], result["predicted_class"], result["probability"])
+
+@app.post("/predict")
+async def predict(file: UploadFile = File(...), uncertainty: bool = False):
+    """
+    Classifies one image. With `uncertainty=true` the answer is the mean over
+    flipped/rotated views and dropout samples, plus its variance and whether
+    the model abstains.
+    """
+    with pool.admit():
+        with stage("read"):
+            contents = await file.read()
+        digest = content_digest(contents)
+        served, shadow = registry.route(digest)
+        version = f"{served.version}+uncertainty" if uncertainty else served.version
+        cache_key = cache.key_for_digest(digest, version)
+        prediction = await cache.get(cache_key)
+        if prediction is None:
+            with served.use():
+                await served.holder.wait_until_ready(MODEL_READY_TIMEOUT)
+                try:
+                    image_array, timings = await pool.decode_timed(contents, IMG_SIZE)
+                except Image.DecompressionBombError as e:
+                    # Not an OSError/ValueError subclass, so it needs its own clause
+                    ERRORS.labels("/predict", "image_too_large").inc()
+                    raise HTTPException(status_code=413, detail=str(e))
+                except (OSError, ValueError) as e:
+                    ERRORS.labels("/predict", "bad_image").inc()
+                    raise HTTPException(status_code=400, detail=f"Cannot read image: {e}")
+                observe_stages(timings)
+                if uncertainty:
+                    batcher = await registry.uncertainty(served)
+                    prediction = summarize(await batcher.submit(image_array))
+                else:
+                    prediction = await served.batcher.submit(image_array)
+            cache.put(cache_key, prediction)
+            if shadow is not None and not uncertainty:
+                registry.submit_shadow(shadow, image_array, prediction)
+    registry.record_prediction(served)
+    predicted_class, probability = format_prediction(prediction)
 
-        return {
+    # Store in session log
+    log_prediction({
+        "filename": file.filename,
+        "predicted_class": predicted_class,
+        "probability": probability,
+    })
+
+    with stage("serialize"):
+        content = {
             "predicted_class": predicted_class,
-            "probability": probability
+            "probability": probability,
+            "model_version": served.version,
         }
+        if uncertainty:
+            content["uncertainty"] = describe_uncertainty(
+                prediction, UNCERTAINTY_ABSTAIN_STD, UNCERTAINTY_ABSTAIN_MARGIN)
+        return JSONResponse(content)
+
+
+def archive_limits():
+    return ArchiveLimits(
+        max_members=ARCHIVE_MAX_IMAGES,
+        max_member_bytes=int(ARCHIVE_MAX_IMAGE_MB * 1024 * 1024),
+        max_total_bytes=int(ARCHIVE_MAX_TOTAL_MB * 1024 * 1024),
+    )
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that closes its body generator and then `resources`
+    when it ends, whether the body was sent in full, cut short by a client
+    disconnect, or never started.
+    """
+
+    def __init__(self, content, resources, **kwargs):
+        super().__init__(content, **kwargs)
+        self.generator = content
+        self.resources = resources
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.generator.aclose()
+            finally:
+                self.resources.close()
+
+
+@app.post("/predict/batch")
+async def predict_many(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+):
+    """
+    Scores many images in one request, given either as a multipart list under
+    `files` or as a single ZIP/tar under `archive`. Results are streamed back as
+    NDJSON, one line per image, followed by a summary line.
+    """
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="Send images as 'files' or an 'archive'")
+    # The whole batch stays on the primary it started with, even across a promotion
+    served = registry.primary
+    await served.holder.wait_until_ready(MODEL_READY_TIMEOUT)
+
+    # Released by the response once it is done, even if the client disconnects
+    # before the body starts
+    resources = ExitStack()
+    resources.enter_context(pool.admit())
+    resources.enter_context(served.use())
+    try:
+        # The uploads are closed once this handler returns, so copy them out first
+        if archive is not None:
+            spool = resources.enter_context(tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024))
+            await asyncio.to_thread(shutil.copyfileobj, archive.file, spool)
+            spool.seek(0)
+            await asyncio.to_thread(check_archive, spool, archive.filename or "", archive_limits())
+            items = iter_archive(spool, archive.filename or "", archive_limits())
+        else:
+            # Other file types get an error line each, so they are not silently dropped
+            items = [(f.filename or "", await f.read() if is_image_name(f.filename or "") else b"") for f in files]
+    except ArchiveTooLarge as e:
+        resources.close()
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        resources.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        resources.close()
+        raise
+
+    body = predict_stream(
+        items, pool, served.predict_batch, IMG_SIZE,
+        batch_size=BATCH_PREDICT_SIZE, on_result=log_prediction,
+    )
+    return ReleasingStreamingResponse(body, resources, media_type="application/x-ndjson")
+
+
+@app.post("/similar")
+async def similar(file: UploadFile = File(...), k: int = Query(5, ge=1, le=50)):
+    """The `k` labeled reference images closest to the upload in embedding space."""
+    if similarity_index is None:
+        raise HTTPException(status_code=503, detail="No similarity index; build one with scripts/build_embedding_index.py")
+    with pool.admit():
+        contents = await file.read()
+        await embedder.wait_until_ready(MODEL_READY_TIMEOUT)
+        try:
+            image_array = await pool.decode(contents, IMG_SIZE)
+        except Image.DecompressionBombError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Cannot read image: {e}")
+        embedding = await asyncio.get_running_loop().run_in_executor(
+            pool.inference_executor, embedder.predict_on_batch, image_array[None])
+        matches = similarity_index.search(embedding[0], k)
+    return {
+        "matches": matches,
+        "index_size": len(similarity_index),
+        "index_model_version": similarity_index.meta["model_version"],
+    }
+
+@app.post("/predict/tiled")
+async def predict_tiled(
+    file: UploadFile = File(...),
+    stride: int = Query(TILE_STRIDE, ge=16, le=IMG_SIZE),
+    scale: int = Query(1, ge=1, le=64),
+    threshold: float = Query(0.5, ge=0.0, le=1.0),
+):
+    """
+    Whole-slide mode: scores the image as overlapping IMG_SIZE x IMG_SIZE tiles
+    (`stride` pixels apart, after downscaling by `scale`) and returns the
+    per-tile malignant-probability heatmap plus a slide-level verdict.
+    """
+    served = registry.primary
+    with pool.admit(), served.use():
+        await served.holder.wait_until_ready(MODEL_READY_TIMEOUT)
+
+        # Decoding and tiling run in worker threads; the inference executor
+        # only gets one tile batch at a time, interleaved with /predict batches
+        try:
+            source = await asyncio.to_thread(
+                open_tile_source, file.file, scale=scale, max_pixels=TILED_MAX_PIXELS)
+            result = await score_tiles(
+                source, served.predict_batch, pool.inference_executor, tile=IMG_SIZE, stride=stride,
+                batch_size=TILE_BATCH_SIZE, threshold=threshold,
+            )
+        except SlideTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Cannot read image: {e}")
 
-    except Exception as e:
-        return {"error": str(e)}
+    log_prediction({
+        "filename": file.filename,
+        "predicted_class": result["predicted_class"],
+        "probability": result["probability"],
+    })
+    return {**result, "model_version": served.version}
@@ -0,0 +1,62 @@
+"""
+Prometheus metrics for the API, exposed at /metrics.
+
+Besides the series defined here, the default registry exports the process
+collector's metrics (process_resident_memory_bytes, CPU seconds, open fds) on
+Linux.
+"""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Normalize takes ~100us, a forward pass on a cold CPU several seconds
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STAGE_SECONDS = Histogram(
+    "inference_stage_seconds",
+    "Time spent in each stage of a prediction: read, decode, resize, normalize, predict, serialize",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency until the response headers are sent",
+    ["method", "path"],
+)
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status code", ["method", "path", "status"])
+ERRORS = Counter("prediction_errors_total", "Failed predictions by route and reason", ["path", "reason"])
+PREDICTIONS = Counter("predictions_total", "Predictions by predicted class", ["predicted_class"])
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time to open the model artifact and to run the warm-up pass", ["step"])
+MODEL_PREDICTIONS = Counter("model_predictions_total", "Predictions served by each model version", ["model_version"])
+SHADOW_COMPARISONS = Counter(
+    "shadow_comparisons_total",
+    "Shadow predictions of the candidate model by outcome: agree, disagree, skipped or error",
+    ["model_version", "outcome"],
+)
+LOADED_MODEL_BYTES = Gauge("loaded_model_bytes", "Artifact size of the models currently loaded in the registry")
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def observe_stages(timings):
+    """Records a dict of stage name -> seconds, as returned by `decode_image_timed`."""
+    for name, seconds in timings.items():
+        STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def route_path(request):
+    # The route template, not the raw URL, keeps the label set small
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
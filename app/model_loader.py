@@ -0,0 +1,183 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class ModelNotReady(Exception):
+    """Raised when a prediction is requested before the model finished loading."""
+
+
+class KerasModel:
+    def __init__(self, path):
+        from tensorflow.keras.models import load_model
+        self.model = load_model(path)
+
+    def predict_on_batch(self, images):
+        return np.asarray(self.model.predict_on_batch(images))
+
+
+class SavedModel:
+    """A SavedModel directory exported with `model.export()` (Keras 3) or `tf.saved_model.save`."""
+
+    def __init__(self, path):
+        import tensorflow as tf
+        self.tf = tf
+        self.model = tf.saved_model.load(path)
+        self.fn = self.model.signatures["serving_default"]
+        self.input_name = next(iter(self.fn.structured_input_signature[1]))
+
+    def predict_on_batch(self, images):
+        outputs = self.fn(**{self.input_name: self.tf.constant(images, dtype=self.tf.float32)})
+        return next(iter(outputs.values())).numpy()
+
+
+def _tflite_interpreter_class():
+    # Prefer the standalone runtimes so serving does not need to import TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """
+    A .tflite flatbuffer. The interpreter is not thread-safe, so calls are
+    serialized; the input tensor is resized whenever the batch size changes.
+    """
+
+    def __init__(self, path, num_threads=None):
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        self.lock = threading.Lock()
+
+    def predict_on_batch(self, images):
+        with self.lock:
+            if images.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], images.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = images.shape[0]
+            self.interpreter.set_tensor(self.input["index"], images.astype(self.input["dtype"], copy=False))
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output["index"]).copy()
+
+
+class OnnxModel:
+    """An .onnx model run with ONNX Runtime on CPU; no TensorFlow import needed."""
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_on_batch(self, images):
+        return self.session.run(None, {self.input_name: images.astype(np.float32, copy=False)})[0]
+
+
+BACKENDS = {
+    "keras": KerasModel,
+    "savedmodel": SavedModel,
+    "tflite": TFLiteModel,
+    "onnx": OnnxModel,
+}
+
+
+def detect_backend(path):
+    """Infers the backend from the artifact: .tflite/.onnx file, SavedModel directory or .keras/.h5 file."""
+    if path.endswith(".tflite"):
+        return "tflite"
+    if path.endswith(".onnx"):
+        return "onnx"
+    if os.path.isdir(path):
+        return "savedmodel"
+    return "keras"
+
+
+def open_model(path, backend="auto"):
+    if backend == "auto":
+        backend = detect_backend(path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {sorted(BACKENDS)} or 'auto'.")
+    return BACKENDS[backend](path)
+
+
+class ModelHolder:
+    """
+    Loads the model lazily and reports readiness.
+
+    `load()` opens the artifact and runs one warm-up forward pass, recording how
+    long each step took. `load_async()` does the same on a worker thread so the
+    server can bind and answer health checks in the meantime.
+    """
+
+    def __init__(self, path, img_size, backend="auto"):
+        self.path = path
+        self.img_size = img_size
+        self.backend = backend
+        self.model = None
+        self.error = None
+        self.timings = {}
+        self._ready = asyncio.Event()
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    def load(self):
+        start = time.perf_counter()
+        model = open_model(self.path, self.backend)
+        loaded = time.perf_counter()
+        model.predict_on_batch(np.zeros((1, self.img_size, self.img_size, 3), dtype=np.float32))
+        warmed = time.perf_counter()
+
+        self.timings = {
+            "load_seconds": round(loaded - start, 3),
+            "warmup_seconds": round(warmed - loaded, 3),
+        }
+        self.model = model
+
+    async def load_async(self):
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    def unload(self):
+        """Drops the model so its memory can be reclaimed; `load_async()` brings it back."""
+        self.model = None
+        self.error = None
+        self.timings = {}
+        self._ready = asyncio.Event()
+
+    async def wait_until_ready(self, timeout):
+        if not self.ready:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise ModelNotReady("Model is still loading")
+        if self.model is None:
+            raise ModelNotReady(f"Model failed to load: {self.error}")
+
+    def predict_on_batch(self, images):
+        if self.model is None:
+            raise ModelNotReady("Model is not loaded")
+        return self.model.predict_on_batch(images)
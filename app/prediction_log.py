@@ -0,0 +1,212 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+CLASS_NAMES = ["Benign", "Malignant"]
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "f8"),
+    ("predicted_class", "u1"),
+    ("probability", "f4"),
+    ("filename", "S96"),
+])
+
+
+def parse_cursor(cursor):
+    """'<timestamp>_<id>' -> (timestamp, id) of the last record of a page."""
+    timestamp, _, row_id = cursor.rpartition("_")
+    return float(timestamp), int(row_id)
+
+
+class PredictionLog:
+    """
+    Fixed-capacity, array-backed log of predictions with a batched SQLite writer.
+
+    `append()` writes one compact record into a ring buffer and never blocks.
+    A background task flushes new records to SQLite every `flush_interval`
+    seconds (or sooner once `flush_batch` records are waiting).
+    If the buffer wraps before a flush, the oldest unflushed records are dropped
+    and counted. Queries go to SQLite and page newest first by (timestamp, id),
+    so the indexes on time and class serve both the filter and the order,
+    with no scan or sort.
+
+    The same task enforces retention every `prune_interval` seconds: records
+    older than `max_age_seconds` and all but the newest `max_rows` are
+    deleted, so the table stays bounded on an in-memory filesystem such as
+    Cloud Run's. Either limit can be None to disable it.
+    """
+
+    def __init__(self, path, capacity=4096, flush_interval=2.0, flush_batch=256, max_rows=1_000_000,
+                 max_age_seconds=None, prune_interval=300.0):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_age = max_age_seconds
+        self.prune_interval = prune_interval
+        # Flush well before the ring wraps around
+        self.flush_batch = min(flush_batch, max(capacity // 2, 1))
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.written = 0   # total records ever appended
+        self.flushed = 0   # total records handed to SQLite (or dropped)
+        self.dropped = 0
+        self.pruned = 0
+        self._task = None
+        self._wakeup = None
+        self._db_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "id INTEGER PRIMARY KEY, timestamp REAL, predicted_class INTEGER, probability REAL, filename TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_predictions_time ON predictions (timestamp)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_predictions_class_time ON predictions (predicted_class, timestamp)"
+        )
+
+    def append(self, filename, predicted_class, probability, timestamp=None):
+        record = self.records[self.written % self.capacity]
+        record["timestamp"] = time.time() if timestamp is None else timestamp
+        record["predicted_class"] = CLASS_NAMES.index(predicted_class)
+        record["probability"] = probability
+        record["filename"] = (filename or "").encode("utf-8", "replace")[:96]
+        self.written += 1
+
+        if self.written - self.flushed >= self.flush_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take_unflushed(self):
+        pending = self.written - self.flushed
+        if pending > self.capacity:
+            self.dropped += pending - self.capacity
+            self.flushed = self.written - self.capacity
+            pending = self.capacity
+        indices = np.arange(self.flushed, self.written) % self.capacity
+        batch = self.records[indices]  # fancy indexing copies, so the ring can keep moving
+        self.flushed = self.written
+        return batch
+
+    def _write(self, batch):
+        rows = [
+            (float(r["timestamp"]), int(r["predicted_class"]), float(r["probability"]),
+             r["filename"].decode("utf-8", "replace"))
+            for r in batch
+        ]
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO predictions (timestamp, predicted_class, probability, filename) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.execute("COMMIT")
+
+    async def flush(self):
+        batch = self._take_unflushed()
+        if len(batch):
+            await asyncio.to_thread(self._write, batch)
+
+    def _prune(self):
+        with self._db_lock:
+            deleted = 0
+            if self.max_age is not None:
+                deleted += self._db.execute(
+                    "DELETE FROM predictions WHERE timestamp < ?", (time.time() - self.max_age,)).rowcount
+            if self.max_rows is not None:
+                # ids grow with every insert, so everything below the newest max_rows goes
+                deleted += self._db.execute(
+                    "DELETE FROM predictions WHERE id <= (SELECT MAX(id) FROM predictions) - ?",
+                    (self.max_rows,),
+                ).rowcount
+        self.pruned += deleted
+
+    async def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if time.monotonic() - last_prune >= self.prune_interval:
+                await asyncio.to_thread(self._prune)
+                last_prune = time.monotonic()
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._db.close()
+
+    def _select(self, start, end, predicted_class, after, limit):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if predicted_class is not None:
+            clauses.append("predicted_class = ?")
+            params.append(CLASS_NAMES.index(predicted_class))
+        if after is not None:
+            # Keyset: rows strictly older than the last one of the previous page
+            clauses.append("(timestamp, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._db_lock:
+            return self._db.execute(
+                f"SELECT id, timestamp, predicted_class, probability, filename FROM predictions "
+                f"{where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+
+    async def query(self, start=None, end=None, predicted_class=None, cursor=None, limit=100):
+        """
+        Returns the newest matching records first. Pass the returned
+        `next_cursor` as `cursor` to fetch the following page; a malformed
+        cursor raises ValueError.
+        """
+        after = parse_cursor(cursor) if cursor is not None else None
+        await self.flush()
+        rows = await asyncio.to_thread(self._select, start, end, predicted_class, after, limit)
+        items = [
+            {
+                "id": row_id,
+                "filename": filename,
+                "predicted_class": CLASS_NAMES[cls],
+                "probability": round(probability, 4),
+                "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+            }
+            for row_id, ts, cls, probability, filename in rows
+        ]
+        next_cursor = f"{rows[-1][1]!r}_{rows[-1][0]}" if len(items) == limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "written": self.written,
+            "unflushed": self.written - self.flushed,
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+        }
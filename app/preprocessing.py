@@ -0,0 +1,129 @@
+"""
+Image decode/resize/normalize kernel shared by the API and the training scripts.
+
+The fast path avoids work the model never sees:
+    - JPEGs are decoded at reduced scale with `Image.draft`, so a 700x460 slide
+      is IDCT-decoded at 350x230 instead of full size;
+    - the resize first reduces by an integer factor, then resamples
+      (`reducing_gap`), which is much cheaper than a full-size bicubic filter;
+    - normalization writes straight into a float32 buffer, which can be supplied
+      by the caller, without any float64 intermediate.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+REDUCING_GAP = 2.0
+
+
+def _as_size(size):
+    return (size, size) if isinstance(size, int) else tuple(size)
+
+
+def _open_rgb(source, size, fast, max_pixels=None):
+    image = Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    # Image.open only reads the header, so this is checked before any pixel is decoded
+    if max_pixels is not None and image.size[0] * image.size[1] > max_pixels:
+        raise Image.DecompressionBombError(
+            f"Image size ({image.size[0] * image.size[1]} pixels) exceeds limit of {max_pixels} pixels")
+    if fast:
+        # Only JPEG supports draft mode; for other formats this is a no-op
+        image.draft("RGB", size)
+    return image.convert("RGB")
+
+
+def load_resized(source, size, fast=True, max_pixels=None):
+    """
+    Opens `source` (a path or raw bytes) and returns an RGB PIL image of `size`
+    (W, H). Images over `max_pixels` raise `Image.DecompressionBombError`.
+    """
+    size = _as_size(size)
+    return _open_rgb(source, size, fast, max_pixels).resize(size, reducing_gap=REDUCING_GAP if fast else None)
+
+
+def decode_uint8(source, size, fast=True):
+    """Decoded and resized image as a (H, W, 3) uint8 array."""
+    return np.asarray(load_resized(source, size, fast), dtype=np.uint8)
+
+
+def decode_into(source, out, fast=True, max_pixels=None):
+    """
+    Decodes `source` into the preallocated float32 buffer `out` of shape
+    (H, W, 3), scaled to [0, 1]. Returns `out`.
+    """
+    height, width = out.shape[:2]
+    pixels = np.asarray(load_resized(source, (width, height), fast, max_pixels))
+    np.divide(pixels, 255, out=out, dtype=np.float32)
+    return out
+
+
+def decode_image(source, size, fast=True, max_pixels=None):
+    """Decoded, resized and normalized image as a new (H, W, 3) float32 array."""
+    width, height = _as_size(size)
+    return decode_into(source, np.empty((height, width, 3), dtype=np.float32), fast, max_pixels)
+
+
+def decode_image_timed(source, size, fast=True, max_pixels=None):
+    """
+    `decode_image` that also returns how many seconds each stage took, as a
+    dict with keys "decode", "resize" and "normalize".
+    """
+    width, height = _as_size(size)
+    start = time.perf_counter()
+    image = _open_rgb(source, (width, height), fast, max_pixels)
+    decoded = time.perf_counter()
+    image = image.resize((width, height), reducing_gap=REDUCING_GAP if fast else None)
+    resized = time.perf_counter()
+    out = np.empty((height, width, 3), dtype=np.float32)
+    np.divide(np.asarray(image), 255, out=out, dtype=np.float32)
+    done = time.perf_counter()
+    return out, {"decode": decoded - start, "resize": resized - decoded, "normalize": done - resized}
+
+
+def _decode_task(args):
+    index, source, size, fast = args
+    try:
+        return index, decode_uint8(source, size, fast), None
+    except Exception as e:
+        return index, None, str(e)
+
+
+def decode_many(sources, size, workers=None, out=None, fast=True, chunksize=16):
+    """
+    Bulk mode: decodes many images (paths or bytes) on a process pool.
+
+    Workers send back uint8 pixels, a quarter of the float32 size, and the
+    parent normalizes them into `out`, a float32 array of shape (N, H, W, 3)
+    that is allocated if not given. Returns (out, errors), where errors is a
+    list of (index, message) for images that failed; their rows are left as
+    zeros. `workers=0` decodes in the calling process.
+    """
+    width, height = _as_size(size)
+    if out is None:
+        out = np.zeros((len(sources), height, width, 3), dtype=np.float32)
+    tasks = [(i, source, (width, height), fast) for i, source in enumerate(sources)]
+    workers = os.cpu_count() if workers is None else workers
+
+    errors = []
+    if workers == 0 or len(tasks) < 2 * chunksize:
+        for index, pixels, error in map(_decode_task, tasks):
+            _store(out, index, pixels, error, errors)
+        return out, errors
+
+    # Spawned workers only import this module, not TensorFlow from the parent
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for index, pixels, error in executor.map(_decode_task, tasks, chunksize=chunksize):
+            _store(out, index, pixels, error, errors)
+    return out, errors
+
+
+def _store(out, index, pixels, error, errors):
+    if error is not None:
+        errors.append((index, error))
+    else:
+        np.divide(pixels, 255, out=out[index], dtype=np.float32)
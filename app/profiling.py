@@ -0,0 +1,50 @@
+"""
+On-demand profiling of the running server, behind /debug/profile.
+
+`cprofile` profiles the event loop thread (request handlers, batching,
+serialization) for a few seconds and returns the hottest functions as text.
+`py-spy` samples every thread, including native TensorFlow frames, from a
+separate process and returns a speedscope JSON profile; it needs the py-spy
+binary and permission to ptrace the server (e.g. CAP_SYS_PTRACE in Docker).
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import shutil
+import tempfile
+
+
+class ProfilerUnavailable(Exception):
+    """Raised when the requested profiler cannot run in this environment."""
+
+
+async def run_cprofile(seconds, limit=50):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+async def run_pyspy(seconds, rate=100):
+    binary = shutil.which("py-spy")
+    if binary is None:
+        raise ProfilerUnavailable("py-spy is not installed (pip install py-spy)")
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "profile.json")
+        process = await asyncio.create_subprocess_exec(
+            binary, "record", "--pid", str(os.getpid()), "--duration", str(seconds),
+            "--rate", str(rate), "--format", "speedscope", "--output", output, "--nonblocking",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0 or not os.path.exists(output):
+            raise ProfilerUnavailable(f"py-spy failed: {stderr.decode(errors='replace').strip()}")
+        with open(output, "rb") as f:
+            return f.read()
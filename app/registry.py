@@ -0,0 +1,364 @@
+"""
+In-process registry of versioned models.
+
+One version is the primary and serves all traffic by default. A second,
+candidate version can either take a percentage of /predict traffic (A/B) or
+run in shadow mode. In shadow mode it sees the same images on a separate
+thread after the primary has answered, and only the agreement with the
+primary is recorded.
+
+Promoting a version loads and warms it up first, then swaps the primary in a
+single assignment on the event loop. Requests already running finish on the
+model they started with, so a rollout drops nothing.
+
+Every loaded model is counted at the size of its artifact. Versions that are
+neither primary nor candidate are unloaded when they have been idle for
+`idle_seconds`, or (least recently used first) when the total exceeds
+`memory_limit_bytes`.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from batching import MicroBatcher
+from metrics import LOADED_MODEL_BYTES, MODEL_PREDICTIONS, SHADOW_COMPARISONS, stage
+from model_loader import ModelHolder
+from uncertainty import UncertaintyEstimator
+
+
+class UnknownModel(Exception):
+    """Raised when a model version is not in the registry."""
+
+
+class RegistryConflict(Exception):
+    """Raised when a registry change would leave routing inconsistent."""
+
+
+def artifact_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+        )
+    return os.path.getsize(path)
+
+
+def traffic_bucket(digest):
+    """Maps a hex content digest to [0, 100), so the same image always takes the same route."""
+    return int(digest[:8], 16) % 10000 / 100.0
+
+
+class RegisteredModel:
+    """One model version: its holder, its own micro-batcher and usage bookkeeping."""
+
+    def __init__(self, version, path, img_size, backend, batch_options):
+        self.version = version
+        self.path = path
+        self.holder = ModelHolder(path, img_size, backend=backend)
+        self.size_bytes = artifact_size(path)
+        self.batcher = MicroBatcher(self.predict_batch, **batch_options)
+        self.registered_at = time.time()
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.load_task = None
+        self.batcher_started = False
+        self.uncertainty_batcher = None
+
+    @property
+    def ready(self):
+        return self.holder.ready
+
+    def predict_batch(self, images):
+        with stage("predict"):
+            return self.holder.predict_on_batch(images)
+
+    @contextmanager
+    def use(self):
+        # Event loop only; a model with requests in flight is never unloaded
+        self.in_flight += 1
+        self.last_used = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+
+    def describe(self):
+        state = "ready" if self.ready else "loading" if self.load_task is not None else (
+            "failed" if self.holder.error is not None else "unloaded")
+        info = {
+            "version": self.version,
+            "path": self.path,
+            "state": state,
+            "size_bytes": self.size_bytes,
+            "in_flight": self.in_flight,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            **self.holder.timings,
+        }
+        if self.holder.error is not None:
+            info["error"] = str(self.holder.error)
+        return info
+
+
+class ModelRegistry:
+    """
+    Holds the registered versions and decides which one serves each request.
+
+    `batch_options` are passed to each version's MicroBatcher (max_batch_size,
+    max_wait_ms, executor, workers). `uncertainty_options` (tta, mc_samples)
+    configure the uncertainty mode, whose batcher is created on first use.
+    Shadow predictions run on their own thread, at most `shadow_queue` at a
+    time; beyond that they are skipped rather than slowing down the primary.
+    """
+
+    def __init__(self, img_size, batch_options=None, uncertainty_options=None, memory_limit_bytes=None,
+                 idle_seconds=None, shadow_queue=8):
+        self.img_size = img_size
+        self.batch_options = batch_options or {}
+        self.uncertainty_options = uncertainty_options or {}
+        self.memory_limit_bytes = memory_limit_bytes
+        self.idle_seconds = idle_seconds
+        self.shadow_queue = shadow_queue
+        self.models = {}
+        self.primary_version = None
+        self.candidate_version = None
+        self.candidate_percent = 0.0
+        self.shadow = False
+        self.shadow_stats = {}
+        self._shadow_pending = 0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._reaper = None
+        LOADED_MODEL_BYTES.set_function(self.loaded_bytes)
+
+    def get(self, version):
+        entry = self.models.get(version)
+        if entry is None:
+            raise UnknownModel(f"Unknown model version {version!r}")
+        return entry
+
+    @property
+    def primary(self):
+        return self.models[self.primary_version]
+
+    @property
+    def candidate(self):
+        return self.models.get(self.candidate_version) if self.candidate_version else None
+
+    def register(self, version, path, backend="auto", primary=False):
+        if version in self.models:
+            raise RegistryConflict(f"Model version {version!r} is already registered")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No model artifact at {path}")
+        entry = RegisteredModel(version, path, self.img_size, backend, self.batch_options)
+        self.models[version] = entry
+        if primary or self.primary_version is None:
+            self.primary_version = version
+        return entry
+
+    async def _start_batcher(self, entry):
+        if not entry.batcher_started:
+            entry.batcher_started = True
+            await entry.batcher.start()
+
+    async def start(self):
+        # Batchers of models registered later start on their first load()
+        for entry in self.models.values():
+            await self._start_batcher(entry)
+        if self.idle_seconds:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for entry in self.models.values():
+            if entry.load_task is not None:
+                entry.load_task.cancel()
+            if entry.batcher_started:
+                await entry.batcher.stop()
+            if entry.uncertainty_batcher is not None:
+                await entry.uncertainty_batcher.stop()
+        self._shadow_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def load(self, version):
+        """
+        Loads and warms up `version` unless it already is. Concurrent callers
+        share one load; a failure is left in `entry.holder.error`.
+        """
+        entry = self.get(version)
+        await self._start_batcher(entry)
+        if entry.ready:
+            return entry
+        if entry.load_task is None:
+            if entry.holder.error is not None:
+                entry.holder.unload()  # retry a failed load
+            entry.load_task = asyncio.create_task(entry.holder.load_async())
+            entry.load_task.add_done_callback(lambda _: setattr(entry, "load_task", None))
+        await asyncio.shield(entry.load_task)
+        if entry.ready:
+            entry.last_used = time.monotonic()
+            await self.enforce_memory_limit(keep=version)
+        return entry
+
+    async def promote(self, version):
+        """Makes `version` the primary once it is loaded; the swap itself is atomic."""
+        entry = await self.load(version)
+        if not entry.ready:
+            raise RegistryConflict(f"Model {version!r} failed to load: {entry.holder.error}")
+        previous = self.primary_version
+        self.primary_version = version
+        if self.candidate_version == version:
+            self.candidate_version, self.candidate_percent, self.shadow = None, 0.0, False
+        return previous
+
+    async def set_candidate(self, version, percent=0.0, shadow=False):
+        """Routes `percent` of traffic to `version`, or shadows all of it; None stops both."""
+        if version is None:
+            self.candidate_version, self.candidate_percent, self.shadow = None, 0.0, False
+            return
+        if version == self.primary_version:
+            raise RegistryConflict(f"Model {version!r} is already the primary")
+        entry = await self.load(version)
+        if not entry.ready:
+            raise RegistryConflict(f"Model {version!r} failed to load: {entry.holder.error}")
+        self.candidate_version, self.candidate_percent, self.shadow = version, percent, shadow
+
+    async def unload(self, version, remove=False):
+        entry = self.get(version)
+        if version in (self.primary_version, self.candidate_version):
+            raise RegistryConflict(f"Model {version!r} is serving traffic; promote or clear another model first")
+        if entry.in_flight:
+            raise RegistryConflict(f"Model {version!r} has {entry.in_flight} requests in flight")
+        if entry.load_task is not None:
+            raise RegistryConflict(f"Model {version!r} is still loading")
+        if entry.uncertainty_batcher is not None:
+            await entry.uncertainty_batcher.stop()
+            entry.uncertainty_batcher = None
+        entry.holder.unload()
+        if remove:
+            if entry.batcher_started:
+                await entry.batcher.stop()
+            del self.models[version]
+
+    async def uncertainty(self, entry):
+        """
+        The batcher for `entry`'s uncertainty mode. Each image costs `tta`
+        backbone passes, so its batches hold proportionally fewer images.
+        """
+        if entry.uncertainty_batcher is None:
+            estimator = UncertaintyEstimator(entry.holder.model, **self.uncertainty_options)
+            options = dict(self.batch_options)
+            options["max_batch_size"] = max(1, options.get("max_batch_size", 16) // estimator.tta)
+
+            def predict_batch(images):
+                with stage("predict"):
+                    return estimator.predict_on_batch(images)
+
+            batcher = MicroBatcher(predict_batch, **options)
+            await batcher.start()
+            entry.uncertainty_batcher = batcher
+        return entry.uncertainty_batcher
+
+    def route(self, digest):
+        """
+        Returns (model that answers, model to shadow or None) for an upload with
+        content digest `digest`.
+        """
+        primary, candidate = self.primary, self.candidate
+        if candidate is None or not candidate.ready:
+            return primary, None
+        if self.shadow:
+            return primary, candidate
+        if traffic_bucket(digest) < self.candidate_percent:
+            return candidate, None
+        return primary, None
+
+    def record_prediction(self, entry):
+        MODEL_PREDICTIONS.labels(entry.version).inc()
+
+    def submit_shadow(self, candidate, image_array, primary_row):
+        """Scores the image with `candidate` off the request path and records whether it agrees."""
+        if self._shadow_pending >= self.shadow_queue:
+            self._record_shadow(candidate.version, "skipped")
+            return
+        self._shadow_pending += 1
+        candidate.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._shadow_executor, candidate.holder.predict_on_batch, image_array[None])
+
+        def done(future):
+            self._shadow_pending -= 1
+            candidate.in_flight -= 1
+            candidate.last_used = time.monotonic()
+            if future.cancelled() or future.exception() is not None:
+                self._record_shadow(candidate.version, "error")
+            else:
+                agree = int(np.argmax(future.result()[0])) == int(np.argmax(primary_row))
+                self._record_shadow(candidate.version, "agree" if agree else "disagree")
+
+        future.add_done_callback(done)
+
+    def _record_shadow(self, version, outcome):
+        counts = self.shadow_stats.setdefault(version, {"agree": 0, "disagree": 0, "skipped": 0, "error": 0})
+        counts[outcome] += 1
+        SHADOW_COMPARISONS.labels(version, outcome).inc()
+
+    def shadow_report(self):
+        report = {}
+        for version, counts in self.shadow_stats.items():
+            compared = counts["agree"] + counts["disagree"]
+            report[version] = {
+                **counts,
+                "disagreement_rate": round(counts["disagree"] / compared, 4) if compared else None,
+            }
+        return report
+
+    def loaded_bytes(self):
+        return sum(entry.size_bytes for entry in self.models.values() if entry.ready)
+
+    def _evictable(self, keep=None):
+        # Least recently used first; the serving models and busy ones stay
+        entries = [
+            entry for entry in self.models.values()
+            if entry.ready and entry.in_flight == 0
+            and entry.version not in (self.primary_version, self.candidate_version, keep)
+        ]
+        return sorted(entries, key=lambda entry: entry.last_used)
+
+    async def _try_unload(self, entry):
+        # Routing or in-flight requests may have changed while an earlier unload awaited
+        try:
+            await self.unload(entry.version)
+        except (RegistryConflict, UnknownModel):
+            pass
+
+    async def enforce_memory_limit(self, keep=None):
+        """Unloads idle versions until the loaded total fits; `keep` and the serving models are never unloaded."""
+        if not self.memory_limit_bytes:
+            return
+        for entry in self._evictable(keep):
+            if self.loaded_bytes() <= self.memory_limit_bytes:
+                break
+            await self._try_unload(entry)
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(self.idle_seconds, 30))
+            now = time.monotonic()
+            for entry in self._evictable():
+                if now - entry.last_used >= self.idle_seconds:
+                    await self._try_unload(entry)
+
+    def describe(self):
+        return {
+            "primary": self.primary_version,
+            "candidate": self.candidate_version,
+            "candidate_percent": self.candidate_percent,
+            "mode": "shadow" if self.shadow else "ab",
+            "loaded_bytes": self.loaded_bytes(),
+            "memory_limit_bytes": self.memory_limit_bytes,
+            "models": [entry.describe() for entry in self.models.values()],
+            "shadow": self.shadow_report(),
+        }
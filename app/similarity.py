@@ -0,0 +1,108 @@
+"""
+Approximate nearest-neighbour search over labeled reference embeddings.
+
+The index is built offline by scripts/build_embedding_index.py. Each image is
+embedded with the classifier's GlobalAveragePooling2D output (512 floats) and
+L2-normalized, so the inner product is the cosine similarity. Vectors are
+grouped into `nlist` clusters (IVF); within a cluster each vector's residual
+is product-quantized into one byte per subspace (64 bytes for 512 dims).
+
+A query scores only the `nprobe` closest clusters, using one small lookup
+table per query (asymmetric distance), then re-ranks the best candidates
+exactly against the float16 vectors. Everything is plain numpy on
+memory-mapped arrays, so nothing is re-run over the reference set.
+"""
+import json
+import os
+
+import numpy as np
+
+META = "meta.json"
+EMBEDDER = "embedder.keras"
+ARRAYS = ("centroids", "codebooks", "offsets", "codes", "vectors", "labels")
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def write_index(directory, centroids, codebooks, offsets, codes, vectors, labels, paths, class_names,
+                model_version=None):
+    """
+    Saves an index. Rows of `codes`, `vectors`, `labels` and `paths` must be
+    sorted by cluster, with cluster `i` at rows offsets[i]:offsets[i + 1].
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        "centroids": centroids.astype(np.float32),
+        "codebooks": codebooks.astype(np.float32),
+        "offsets": offsets.astype(np.int64),
+        "codes": codes.astype(np.uint8),
+        "vectors": vectors.astype(np.float16),
+        "labels": labels.astype(np.uint8),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    meta = {
+        "count": len(paths),
+        "dim": int(centroids.shape[1]),
+        "nlist": int(centroids.shape[0]),
+        "subspaces": int(codebooks.shape[0]),
+        "class_names": list(class_names),
+        "model_version": model_version,
+        "paths": [str(p) for p in paths],
+    }
+    with open(os.path.join(directory, META), "w") as f:
+        json.dump(meta, f)
+
+
+class SimilarityIndex:
+    def __init__(self, directory, nprobe=16, rerank=64):
+        with open(os.path.join(directory, META)) as f:
+            self.meta = json.load(f)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        # The small arrays are touched on every query; keep them in RAM
+        self.centroids = np.array(self.centroids)
+        self.codebooks = np.array(self.codebooks)
+        self.offsets = np.array(self.offsets)
+        self.subspaces, _, self.sub_dim = self.codebooks.shape
+        self.nprobe = min(nprobe, len(self.centroids))
+        self.rerank = rerank
+        self.paths = self.meta["paths"]
+        self.class_names = self.meta["class_names"]
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def search(self, query, k=5):
+        """The `k` nearest reference images to one embedding, most similar first."""
+        query = normalize(query).ravel()
+        coarse = self.centroids @ query
+        probes = np.argpartition(-coarse, self.nprobe - 1)[:self.nprobe]
+
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes])
+        if len(rows) == 0:
+            return []
+        cluster_scores = np.repeat(coarse[probes], np.diff(self.offsets)[probes])
+
+        # <q, centroid + residual> = <q, centroid> + sum over subspaces of <q_m, codeword_m>
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.subspaces, self.sub_dim))
+        codes = self.codes[rows]
+        approx = cluster_scores + table[np.arange(self.subspaces), codes].sum(axis=1)
+
+        candidates = min(max(k, self.rerank), len(rows))
+        best = np.argpartition(-approx, candidates - 1)[:candidates]
+        best_rows = np.sort(rows[best])
+        exact = self.vectors[best_rows].astype(np.float32) @ query
+        order = np.argsort(-exact)[:k]
+
+        return [
+            {
+                "path": self.paths[best_rows[i]],
+                "label": self.class_names[self.labels[best_rows[i]]],
+                "similarity": round(float(exact[i]), 4),
+            }
+            for i in order
+        ]
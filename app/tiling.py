@@ -0,0 +1,190 @@
+"""
+Tiled inference for large histopathology captures.
+
+Instead of squashing the whole image to the model's 128x128 input, the image is
+cut into overlapping tiles of that size. Tiles are produced lazily, one strip
+of rows at a time, mostly-white background tiles are skipped, and the rest go
+through the model in fixed-size batches written into one reusable buffer. The
+result is a per-tile malignant-probability heatmap plus a slide-level verdict.
+
+With `pyvips` (installed in the Docker image, with libvips) the image is
+decoded lazily: pyramidal/tiled formats (TIFF, SVS, ...) are read region by
+region, and formats without random access are decoded to a disk-backed
+temporary above libvips' size threshold instead of RAM. `scale` is applied by
+libvips as part of that pipeline. Without pyvips, PIL decodes the whole image
+once as uint8 (3 bytes per pixel, never float), up to `max_pixels`; there
+only JPEG gets cheaper with `scale`, through draft mode.
+"""
+import asyncio
+import math
+
+import numpy as np
+from PIL import Image
+
+# Mostly-white tiles (glass, not tissue) are not scored
+BACKGROUND_LEVEL = 220
+BACKGROUND_FRACTION = 0.8
+
+
+class SlideTooLarge(Exception):
+    """Raised when an image exceeds the pixel budget of the PIL fallback."""
+
+
+def check_scale(width, height, scale):
+    # Downsampling past one pixel leaves nothing to tile
+    if scale > min(width, height):
+        raise ValueError(f"scale {scale} is larger than the {width}x{height} image")
+
+
+class PILTileSource:
+    def __init__(self, fileobj, scale=1, max_pixels=150_000_000):
+        try:
+            image = Image.open(fileobj)
+        except Image.DecompressionBombError as e:
+            raise SlideTooLarge(str(e))
+        width, height = image.size
+        check_scale(width, height, scale)
+        if scale > 1:
+            # JPEG draft mode decodes straight at the reduced scale
+            image.draft("RGB", (width // scale, height // scale))
+        if image.size[0] * image.size[1] > max_pixels:
+            raise SlideTooLarge(
+                f"{width}x{height} image is over the {max_pixels} pixel limit; "
+                "install pyvips for lazy decoding or pass a larger scale"
+            )
+        image = image.convert("RGB")
+        if scale > 1 and image.size != (width // scale, height // scale):
+            image = image.reduce(max(1, round(image.size[0] / (width // scale))))
+        self.pixels = np.asarray(image)
+        self.height, self.width = self.pixels.shape[:2]
+
+    def strip(self, y, height):
+        return self.pixels[y:y + height]
+
+
+class VipsTileSource:
+    def __init__(self, fileobj, scale=1):
+        import pyvips
+        try:
+            # Uploads spooled to disk are read through their descriptor, not copied
+            fileobj.seek(0)
+            image = pyvips.Image.new_from_source(pyvips.Source.new_from_descriptor(fileobj.fileno()), "")
+        except (AttributeError, OSError, pyvips.Error):
+            fileobj.seek(0)
+            try:
+                image = pyvips.Image.new_from_buffer(fileobj.read(), "")
+            except pyvips.Error as e:
+                raise OSError(str(e))
+        if image.bands == 4:
+            image = image.flatten(background=255)
+        if image.bands == 1:
+            image = image.colourspace("srgb")
+        check_scale(image.width, image.height, scale)
+        if scale > 1:
+            image = image.shrink(scale, scale)
+        self.image = image.cast("uchar")
+        self.width, self.height = self.image.width, self.image.height
+
+    def strip(self, y, height):
+        import pyvips
+        height = min(height, self.height - y)
+        try:
+            return self.image.crop(0, y, self.width, height).numpy()
+        except pyvips.Error as e:
+            # Truncated or corrupt data only shows up once that region is decoded
+            raise OSError(str(e))
+
+
+def open_tile_source(fileobj, scale=1, max_pixels=150_000_000):
+    try:
+        import pyvips  # noqa: F401
+    except (ImportError, OSError):
+        return PILTileSource(fileobj, scale, max_pixels)
+    return VipsTileSource(fileobj, scale)
+
+
+def tile_positions(length, tile, stride):
+    """Start offsets covering [0, length); the last tile is aligned to the end."""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] != length - tile:
+        positions.append(length - tile)
+    return positions
+
+
+def is_background(tile):
+    return np.mean(tile.min(axis=2) > BACKGROUND_LEVEL) > BACKGROUND_FRACTION
+
+
+def tile_batches(source, tile=128, stride=64, batch_size=64):
+    """
+    Yields ((row, col) cells, float32 batch) for every `batch_size` tissue
+    tiles of `source`, reading one strip of `tile` rows at a time.
+
+    Blocking. The batch is a view of one reusable buffer, so consume it
+    before advancing the generator.
+    """
+    ys = tile_positions(source.height, tile, stride)
+    xs = tile_positions(source.width, tile, stride)
+    buffer = np.zeros((batch_size, tile, tile, 3), dtype=np.float32)
+    cells = []
+    for r, y in enumerate(ys):
+        strip = source.strip(y, tile)
+        for c, x in enumerate(xs):
+            patch = strip[:, x:x + tile]
+            if is_background(patch):
+                continue
+            slot = buffer[len(cells)]
+            if patch.shape[:2] != (tile, tile):
+                # Image smaller than one tile: pad with white, like glass
+                slot[:] = 1.0
+            np.divide(patch, 255, out=slot[:patch.shape[0], :patch.shape[1]], dtype=np.float32)
+            cells.append((r, c))
+            if len(cells) == batch_size:
+                yield cells, buffer
+                cells = []
+    if cells:
+        yield cells, buffer[:len(cells)]
+
+
+async def score_tiles(source, predict_fn, executor=None, tile=128, stride=64, batch_size=64, threshold=0.5):
+    """
+    Runs every tissue tile of `source` through `predict_fn` and aggregates.
+
+    Tiles are cut in a worker thread, and each batch is a separate job on
+    `executor`, so other requests sharing that executor are not held up for
+    the whole slide. Memory use is one strip of `tile` rows plus one
+    (batch_size, tile, tile, 3) float32 buffer, on top of the source itself.
+    """
+    loop = asyncio.get_running_loop()
+    heatmap = np.full(
+        (len(tile_positions(source.height, tile, stride)), len(tile_positions(source.width, tile, stride))),
+        np.nan, dtype=np.float32,
+    )
+    batches = tile_batches(source, tile, stride, batch_size)
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        cells, images = batch
+        probs = await loop.run_in_executor(executor, predict_fn, images)
+        for (r, c), row in zip(cells, probs):
+            heatmap[r, c] = float(row[1])
+
+    scored = heatmap[~np.isnan(heatmap)]
+    malignant_prob = float(scored.mean()) if len(scored) else 0.0
+    predicted_class = "Malignant" if malignant_prob > threshold else "Benign"
+    return {
+        "predicted_class": predicted_class,
+        "probability": round(malignant_prob if predicted_class == "Malignant" else 1 - malignant_prob, 4),
+        "image_size": [source.width, source.height],
+        "tile_size": tile,
+        "stride": stride,
+        "tiles": int(heatmap.size),
+        "tissue_tiles": int(len(scored)),
+        "malignant_tiles": int(np.sum(scored > threshold)),
+        "max_malignant_probability": round(float(scored.max()), 4) if len(scored) else None,
+        # Rows of per-tile malignant probability; null where the tile is background
+        "heatmap": [[None if math.isnan(v) else round(float(v), 4) for v in row] for row in heatmap],
+    }
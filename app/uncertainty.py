@@ -0,0 +1,104 @@
+"""
+Uncertainty mode for /predict: test-time augmentation (TTA) and Monte-Carlo
+dropout in one batched pass.
+
+Every image is expanded into up to 8 views: the flips and rotations of the
+square, to which a histology patch has no preferred orientation. The
+convolutional backbone runs once over all views. Its pooled features are then
+repeated `mc_samples` times and only the small dense head runs again, with
+its Dropout layers active and BatchNormalization still in inference mode. The
+spread of the resulting probabilities measures how sure the model is.
+
+MC dropout needs the Keras model. Exported backends (SavedModel, TFLite,
+ONNX) have no separate head, so they get TTA only.
+"""
+import numpy as np
+
+from model_loader import KerasModel
+
+MAX_TTA = 8
+
+
+def tta_views(images, count):
+    """(N, H, W, C) square images -> (N, count, H, W, C): identity, flips, rotations and transposes."""
+    views = []
+    for flip in (False, True):
+        flipped = images[:, :, ::-1] if flip else images
+        for k in (0, 2, 1, 3):
+            views.append(np.rot90(flipped, k, axes=(1, 2)))
+    order = [0, 4, 1, 5, 2, 6, 3, 7]  # identity, horizontal flip, rotate 180, vertical flip, then the rest
+    return np.stack([views[i] for i in order[:count]], axis=1)
+
+
+def summarize(samples):
+    """(S, 2) sampled softmax rows -> [mean benign, mean malignant, malignant variance, S]."""
+    samples = np.asarray(samples, dtype=np.float64)
+    mean = samples.mean(axis=0)
+    return [float(mean[0]), float(mean[1]), float(samples[:, 1].var()), float(len(samples))]
+
+
+def describe(summary, abstain_std, margin=0.05):
+    """
+    The uncertainty part of the /predict response. The model abstains when
+    the malignant probability varies by more than `abstain_std`, or when its
+    mean lies within two standard deviations (and at least `margin`) of the
+    0.5 decision boundary.
+    """
+    _, malignant, variance, samples = summary
+    std = variance ** 0.5
+    return {
+        "mean_malignant_probability": round(malignant, 4),
+        "variance": round(variance, 6),
+        "std": round(std, 4),
+        "samples": int(samples),
+        "abstain": bool(std > abstain_std or abs(malignant - 0.5) < max(2 * std, margin)),
+    }
+
+
+class UncertaintyEstimator:
+    """
+    `predict_on_batch(images)` returns (N, tta * mc_samples, 2) sampled
+    softmax rows, computed with `tta` backbone passes per image.
+    """
+
+    def __init__(self, model, tta=8, mc_samples=16):
+        if not 1 <= tta <= MAX_TTA:
+            raise ValueError(f"tta must be between 1 and {MAX_TTA}, got {tta}")
+        self.model = model
+        self.tta = tta
+        self.mc_samples = mc_samples if isinstance(model, KerasModel) else 1
+        self._forward = self._build_keras_forward(model.model) if isinstance(model, KerasModel) else None
+
+    @property
+    def samples(self):
+        return self.tta * self.mc_samples
+
+    def _build_keras_forward(self, keras_model):
+        import tensorflow as tf
+        from tensorflow import keras
+
+        # The head starts after the first layer with flat (N, D) output (the pooling layer)
+        split = next(i for i, layer in enumerate(keras_model.layers) if len(layer.output.shape) == 2)
+        backbone = keras.Model(keras_model.input, keras_model.layers[split].output)
+        head = keras_model.layers[split + 1:]
+        mc_samples = self.mc_samples
+
+        @tf.function(reduce_retracing=True)
+        def forward(views):
+            features = backbone(views, training=False)
+            x = tf.repeat(features, mc_samples, axis=0)
+            for layer in head:
+                x = layer(x, training=isinstance(layer, keras.layers.Dropout))
+            return x
+
+        return forward
+
+    def predict_on_batch(self, images):
+        count = len(images)
+        views = tta_views(images, self.tta).reshape(count * self.tta, *images.shape[1:])
+        views = np.ascontiguousarray(views, dtype=np.float32)
+        if self._forward is not None:
+            probs = self._forward(views).numpy()
+        else:
+            probs = np.asarray(self.model.predict_on_batch(views))
+        return probs.reshape(count, self.samples, -1)
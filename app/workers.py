@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from preprocessing import decode_image, decode_image_timed
+
+
+class Overloaded(Exception):
+    """Raised when more requests are in flight than the pool accepts."""
+
+
+class DecodeUnavailable(Exception):
+    """Raised when a decode worker died mid-request; the pool has been rebuilt for the next one."""
+
+
+class WorkerPool:
+    """
+    Bounded executors for the CPU-bound stages of a prediction.
+
+    PIL decoding runs in `decode_workers` processes (or the default thread pool
+    when 0), TensorFlow inference in `inference_workers` threads. At most
+    `max_pending` requests are admitted at once; the rest get `Overloaded`.
+
+    Images over `max_pixels` are refused from their header, before decoding.
+    If a decode process dies anyway (e.g. OOM-killed), the process pool is
+    replaced and the requests that were using it get `DecodeUnavailable`.
+    """
+
+    def __init__(self, decode_workers=2, inference_workers=1, max_pending=64, max_pixels=None):
+        self.decode_workers = decode_workers
+        self.inference_workers = inference_workers
+        self.max_pending = max_pending
+        self.max_pixels = max_pixels
+        self.pending = 0
+        self.decode_restarts = 0
+
+        self.decode_executor = self._new_decode_executor() if decode_workers > 0 else None
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=inference_workers,
+            thread_name_prefix="inference",
+        )
+
+    def acquire(self):
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self.pending >= self.max_pending:
+            raise Overloaded(f"{self.pending} requests already in flight")
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _new_decode_executor(self):
+        # Spawned workers only import this module, not TensorFlow from the parent
+        return ProcessPoolExecutor(
+            max_workers=self.decode_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    async def _run_decode(self, fn, contents, img_size):
+        executor = self.decode_executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, fn, contents, img_size, True, self.max_pixels)
+        except BrokenProcessPool as e:
+            # Concurrent failures share one broken pool; only the first replaces it
+            if self.decode_executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.decode_executor = self._new_decode_executor()
+                self.decode_restarts += 1
+            raise DecodeUnavailable("An image decoder crashed; please retry") from e
+
+    async def decode(self, contents, img_size):
+        return await self._run_decode(decode_image, contents, img_size)
+
+    async def decode_timed(self, contents, img_size):
+        """Like `decode`, but returns (image, per-stage seconds)."""
+        return await self._run_decode(decode_image_timed, contents, img_size)
+
+    def shutdown(self):
+        if self.decode_executor is not None:
+            self.decode_executor.shutdown(wait=False, cancel_futures=True)
+        self.inference_executor.shutdown(wait=False, cancel_futures=True)
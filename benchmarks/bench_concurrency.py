@@ -0,0 +1,108 @@
+"""
+Concurrency benchmark for the /predict pipeline.
+
+Pushes synthetic PNG uploads through the same WorkerPool + MicroBatcher the API
+uses and reports throughput for each (decode workers, inference workers) pair.
+Without --model, a NumPy matmul stands in for the forward pass so the benchmark
+runs anywhere; with --model, the real Keras model is used.
+
+    python benchmarks/bench_concurrency.py --requests 256 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from batching import MicroBatcher  # noqa: E402
+from workers import WorkerPool  # noqa: E402
+
+IMG_SIZE = 128
+
+
+def make_png(size=460, seed=0):
+    # BreaKHis images are 700x460, so a square of that side is a fair stand-in
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_predict_fn(model_path):
+    if model_path:
+        from tensorflow.keras.models import load_model
+        model = load_model(model_path)
+        return model.predict_on_batch
+
+    weights = np.random.default_rng(0).standard_normal((IMG_SIZE * IMG_SIZE * 3, 256)).astype(np.float32)
+
+    def fake_predict(images):
+        hidden = images.reshape(len(images), -1) @ weights
+        logits = hidden[:, :2]
+        return np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+    return fake_predict
+
+
+async def run_once(predict_fn, payloads, decode_workers, inference_workers, max_batch_size):
+    pool = WorkerPool(decode_workers=decode_workers, inference_workers=inference_workers, max_pending=len(payloads))
+    batcher = MicroBatcher(
+        predict_fn,
+        max_batch_size=max_batch_size,
+        max_wait_ms=5,
+        executor=pool.inference_executor,
+        workers=inference_workers,
+    )
+    await batcher.start()
+
+    async def one(contents):
+        with pool.admit():
+            image_array = await pool.decode(contents, IMG_SIZE)
+            return await batcher.submit(image_array)
+
+    # Warm up the process pool so spawn time is not counted
+    await asyncio.gather(*(one(p) for p in payloads[: max(decode_workers, 1) * 2]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in payloads))
+    elapsed = time.perf_counter() - start
+
+    await batcher.stop()
+    pool.shutdown()
+    return elapsed, batcher.stats.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4],
+                        help="Decode process counts to try (0 = decode in threads)")
+    parser.add_argument("--inference-workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--model", default=None, help="Path to a .keras model (default: synthetic)")
+    args = parser.parse_args()
+
+    predict_fn = make_predict_fn(args.model)
+    payloads = [make_png(seed=i % 8) for i in range(args.requests)]
+
+    print(f"{'decode':>7} {'infer':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'avg batch':>10}")
+    for decode_workers in args.workers:
+        for inference_workers in args.inference_workers:
+            elapsed, stats = asyncio.run(
+                run_once(predict_fn, payloads, decode_workers, inference_workers, args.max_batch_size)
+            )
+            print(
+                f"{decode_workers:>7} {inference_workers:>6} {args.requests / elapsed:>9.1f} "
+                f"{stats['latency_p50_ms']:>9.1f} {stats['latency_p99_ms']:>9.1f} {stats['avg_batch_size']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Decode throughput micro-benchmark.
+
+Compares the original `Image.open -> convert -> resize -> np.array / 255.0`
+sequence with the shared fast path in app/preprocessing.py (draft-mode JPEG
+decoding, reduce-then-resample, float32 output buffer), single-process and on
+a process pool. Inputs are synthetic 700x460 images, the BreaKHis size.
+
+    python benchmarks/bench_decode.py --images 400 --format jpeg png
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from preprocessing import decode_into, decode_many  # noqa: E402
+
+IMG_SIZE = 128
+
+
+def write_images(directory, count, fmt, size=(700, 460)):
+    rng = np.random.default_rng(0)
+    # Smooth noise compresses like tissue rather than like pure noise
+    base = rng.integers(0, 256, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    paths = []
+    for i in range(count):
+        image = Image.fromarray(np.roll(base, i, axis=0)).resize(size, Image.BILINEAR)
+        path = os.path.join(directory, f"img_{i}.{'jpg' if fmt == 'jpeg' else 'png'}")
+        image.save(path, format=fmt.upper(), quality=90)
+        paths.append(path)
+    return paths
+
+
+def legacy(paths):
+    # The sequence previously used in app/main.py and load_Preprcess_data
+    images = []
+    for path in paths:
+        img = Image.open(path).convert('RGB').resize((IMG_SIZE, IMG_SIZE))
+        images.append(np.array(img) / 255.0)
+    return np.array(images, dtype=np.float32)
+
+
+def fast_single(paths):
+    out = np.empty((len(paths), IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        decode_into(path, out[i])
+    return out
+
+
+def fast_pool(paths, workers):
+    return decode_many(paths, IMG_SIZE, workers=workers)[0]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=400)
+    parser.add_argument("--format", nargs="+", default=["jpeg", "png"], choices=["jpeg", "png"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in args.format:
+            paths = write_images(directory, args.images, fmt)
+            legacy_time, reference = timed(legacy, paths)
+            rows = [("legacy", legacy_time, reference)]
+            rows.append(("fast path", *timed(fast_single, paths)))
+            rows.append((f"fast path, {args.workers} procs", *timed(fast_pool, paths, args.workers)))
+
+            print(f"\n{fmt.upper()} ({args.images} images)")
+            print(f"{'method':<24} {'img/s':>9} {'speedup':>8} {'mean abs diff':>14}")
+            for name, elapsed, images in rows:
+                diff = float(np.mean(np.abs(images - reference)))
+                print(f"{name:<24} {args.images / elapsed:>9.0f} {legacy_time / elapsed:>7.1f}x {diff:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Cold-start benchmark for the API's model loading.
+
+Each run happens in a fresh interpreter and times the three startup stages
+separately: importing the runtime, loading the artifact, and the first
+(warm-up) forward pass. A second forward pass is timed for comparison.
+
+    python benchmarks/bench_startup.py app/model/model.keras app/model/savedmodel app/model/model.tflite
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+IMG_SIZE = 128
+
+
+def child(model_path):
+    start = time.perf_counter()
+    sys.path.insert(0, APP_DIR)
+    import numpy as np
+    import model_loader
+    # Import the runtime the loader will need, so it is not counted as load time
+    backend = model_loader.detect_backend(model_path)
+    if backend == "tflite":
+        model_loader._tflite_interpreter_class()
+    elif backend == "onnx":
+        import onnxruntime  # noqa: F401
+    else:
+        import tensorflow  # noqa: F401
+    imported = time.perf_counter()
+
+    model = model_loader.open_model(model_path)
+    loaded = time.perf_counter()
+
+    images = np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    model.predict_on_batch(images)
+    first = time.perf_counter()
+    model.predict_on_batch(images)
+    second = time.perf_counter()
+
+    print(json.dumps({
+        "import": imported - start,
+        "load": loaded - imported,
+        "first_inference": first - loaded,
+        "second_inference": second - first,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", help="Model artifacts (.keras, SavedModel dir, .tflite, .onnx)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.models[0])
+        return
+
+    stages = ["import", "load", "first_inference", "second_inference"]
+    print(f"{'model':<40} " + " ".join(f"{s:>17}" for s in stages))
+    for model_path in args.models:
+        runs = []
+        for _ in range(args.runs):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", model_path],
+                capture_output=True, text=True, check=True,
+                env={**os.environ, "TF_CPP_MIN_LOG_LEVEL": "3"},
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        medians = [statistics.median(r[s] for r in runs) for s in stages]
+        print(f"{model_path:<40} " + " ".join(f"{m * 1000:>15.0f}ms" for m in medians))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Reproducible benchmark suite for the API and the training pipeline.
+
+Runs offline on CPU: the images are synthetic 700x460 H&E-coloured PNG/JPEG
+files (the BreaKHis size), and the model is the real VGG16 architecture with
+random weights unless --model is given. It measures:
+
+    - /predict, in-process through the ASGI app, at several concurrency levels
+      (requests/sec, p50/p95/p99 latency), for each image format;
+    - load_Preprcess_data on a small synthetic dataset;
+    - augmentation throughput (augment_exactly);
+    - one train_model epoch on that dataset.
+
+Results are written as JSON. With --baseline, every metric is compared with a
+stored run and the script exits with status 1 if any regressed by more than
+--tolerance.
+
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --output new.json --baseline bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+IMG_SIZE = 128
+IMAGE_SIZE = (700, 460)
+DATASET_DIR = os.path.join("raw_data", "breast_cancer", "BreaKHis_Total_dataset")
+# H&E stain colours: eosin pink and haematoxylin purple
+EOSIN = np.array([235, 170, 200], dtype=np.float32)
+HAEMATOXYLIN = np.array([110, 50, 140], dtype=np.float32)
+
+
+def make_image(seed, fmt, size=IMAGE_SIZE):
+    """A deterministic tissue-like image, encoded as `fmt` ("png" or "jpeg")."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((size[1] // 16, size[0] // 16)).astype(np.float32)
+    mix = np.asarray(Image.fromarray((coarse * 255).astype(np.uint8)).resize(size, Image.BICUBIC), np.float32) / 255
+    pixels = mix[..., None] * HAEMATOXYLIN + (1 - mix[..., None]) * EOSIN
+    pixels += rng.normal(0, 8, pixels.shape)
+    buffer = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format=fmt.upper(), quality=90)
+    return buffer.getvalue()
+
+
+def write_dataset(root, images_per_class):
+    """Writes benign/ and malignant/ folders, half PNG and half JPEG, in the layout get_data_path expects."""
+    for label, cl in enumerate(("benign", "malignant")):
+        class_dir = os.path.join(root, DATASET_DIR, cl)
+        os.makedirs(class_dir, exist_ok=True)
+        for i in range(images_per_class):
+            fmt = "png" if i % 2 else "jpeg"
+            with open(os.path.join(class_dir, f"{cl}_{i}.{'png' if fmt == 'png' else 'jpg'}"), "wb") as f:
+                f.write(make_image(label * 100000 + i, fmt))
+
+
+def build_model_file(path):
+    # Same architecture as training, without downloading ImageNet weights
+    from train_model import build_vgg16_model_unfreeze_2
+    build_vgg16_model_unfreeze_2(weights=None).save(path)
+
+
+def percentiles(latencies):
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+async def load_test(app, payloads, concurrency, total_requests):
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        counter = iter(range(total_requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                response = await client.post("/predict", files={"file": (f"{i}.img", payloads[i % len(payloads)])})
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"rps": round(total_requests / elapsed, 2), "errors": errors, **percentiles(latencies)}
+
+
+def bench_api(workdir, model_path, concurrency_levels, total_requests, formats):
+    # main reads its configuration at import time
+    os.environ.update({
+        "MODEL_PATH": model_path,
+        "MODEL_LOAD_MODE": "blocking",
+        "PREDICTION_CACHE_SIZE": "0",  # every request takes the full decode + predict path
+        "PREDICTION_LOG_PATH": os.path.join(workdir, "predictions.sqlite"),
+        "MAX_PENDING_REQUESTS": str(max(concurrency_levels) * 2),
+        "SIMILARITY_INDEX_PATH": os.path.join(workdir, "no_index"),
+    })
+    import main
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for fmt in formats:
+                payloads = [make_image(i, fmt) for i in range(32)]
+                await load_test(main.app, payloads, 1, 8)  # warm-up
+                for concurrency in concurrency_levels:
+                    result = await load_test(main.app, payloads, concurrency, total_requests)
+                    results[f"{fmt}.c{concurrency}"] = result
+                    print(f"/predict {fmt} c={concurrency}: {result}")
+        return results
+
+    return asyncio.run(run())
+
+
+def bench_training(workdir, images_per_class, target_per_class, augment_images):
+    import tensorflow as tf
+    from augmentation import augment_exactly, build_augmenter
+    from data_preprocessing import load_Preprcess_data
+    from train_model import train_model
+
+    tf.keras.utils.set_random_seed(0)
+    results = {}
+
+    # load_Preprcess_data resolves the dataset relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        X_train, y_train, X_val, y_val, X_test, y_test, _ = load_Preprcess_data(
+            "direct", max_images_per_class=images_per_class, target_per_class=target_per_class)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    total = len(X_train) + len(X_val) + len(X_test)
+    results["load_Preprcess_data"] = {"seconds": round(elapsed, 3), "images_per_sec": round(total / elapsed, 1)}
+
+    augmenter = build_augmenter(seed=0)
+    augment_exactly(X_train[:8], 8, augmenter)  # warm-up: traces the layers
+    start = time.perf_counter()
+    augment_exactly(X_train, augment_images, augmenter, seed=0)
+    elapsed = time.perf_counter() - start
+    results["augmentation"] = {"seconds": round(elapsed, 3), "images_per_sec": round(augment_images / elapsed, 1)}
+
+    start = time.perf_counter()
+    train_model(X_train, y_train, X_val, y_val, output_path=os.path.join(workdir, "bench_model.keras"),
+                epochs=1, weights=None)
+    elapsed = time.perf_counter() - start
+    results["train_epoch"] = {"seconds": round(elapsed, 3), "images_per_sec": round(len(X_train) / elapsed, 1)}
+
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def higher_is_better(metric):
+    return metric.endswith(("rps", "images_per_sec"))
+
+
+def compare(results, baseline, tolerance):
+    """Prints every metric next to the baseline and returns the ones that regressed."""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>11} {'current':>11} {'change':>8}")
+    for metric in sorted(current.keys() & previous.keys()):
+        if metric.endswith("errors"):
+            continue
+        old, new = previous[metric], current[metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better(metric) else change
+        flag = "  REGRESSED" if worse > tolerance else ""
+        print(f"{metric:<44} {old:>11.2f} {new:>11.2f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(metric)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="Earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown per metric")
+    parser.add_argument("--model", default=None, help="Model for the API benchmark (default: random-weight VGG16)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level and format")
+    parser.add_argument("--formats", nargs="+", default=["png", "jpeg"], choices=["png", "jpeg"])
+    parser.add_argument("--images-per-class", type=int, default=48)
+    parser.add_argument("--target-per-class", type=int, default=96)
+    parser.add_argument("--augment-images", type=int, default=512)
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-training", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        write_dataset(workdir, args.images_per_class)
+        if not args.skip_training:
+            results["training"] = bench_training(
+                workdir, args.images_per_class, args.target_per_class, args.augment_images)
+        if not args.skip_api:
+            model_path = args.model
+            if model_path is None:
+                model_path = os.path.join(workdir, "model.keras")
+                build_model_file(model_path)
+            results["api"] = bench_api(workdir, os.path.abspath(model_path), args.concurrency, args.requests,
+                                       args.formats)
+
+    import tensorflow as tf
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "tensorflow": tf.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
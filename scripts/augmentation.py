@@ -0,0 +1,119 @@
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+
+
+def build_augmenter(seed=None):
+    """
+    Random flips, rotation, zoom, contrast and brightness, applied to float
+    images in [0, 1]. Pass `seed` for reproducible augmentations; each layer
+    gets its own seed derived from it.
+    """
+    def layer_seed(offset):
+        # Layers seeded alike start from the same generator state and draw correlated values
+        return None if seed is None else seed + offset
+
+    def brightness(x):
+        # One shift per image, not one for the whole batch
+        shift = tf.random.uniform([tf.shape(x)[0], 1, 1, 1], -0.1, 0.1, seed=layer_seed(4))
+        # Under a mixed precision policy the layers hand over bfloat16 images
+        return tf.clip_by_value(x + tf.cast(shift, x.dtype), 0.0, 1.0)
+
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal_and_vertical", seed=layer_seed(0)),
+        tf.keras.layers.RandomRotation(0.2, seed=layer_seed(1)),
+        tf.keras.layers.RandomZoom(0.1, seed=layer_seed(2)),
+        tf.keras.layers.RandomContrast(0.2, seed=layer_seed(3)),
+        tf.keras.layers.Lambda(brightness),
+    ])
+
+
+def augment_exactly(images, needed, augmenter=None, batch_size=256, seed=42):
+    """
+    Generates exactly `needed` augmented images from `images` (float32, N x H x W x C).
+
+    Source images are drawn from a seeded permutation, cycling so every image is
+    used as evenly as possible, and augmented in fixed-size batches written
+    straight into one preallocated float32 array. Nothing is computed and thrown
+    away, and no per-image Python lists are built.
+    """
+    augmenter = augmenter or build_augmenter(seed)
+    rng = np.random.default_rng(seed)
+    order = np.concatenate([rng.permutation(len(images)) for _ in range(math.ceil(needed / len(images)))])[:needed]
+
+    augmented = np.empty((needed, *images.shape[1:]), dtype=np.float32)
+    start_time = time.perf_counter()
+    for start in range(0, needed, batch_size):
+        batch = order[start:start + batch_size]
+        augmented[start:start + len(batch)] = augmenter(images[batch], training=True)
+    elapsed = time.perf_counter() - start_time
+    print(f"Augmented {needed} images in {elapsed:.1f}s ({needed / max(elapsed, 1e-9):.0f} images/sec)")
+    return augmented
+
+
+def make_oversampled_dataset(X, y, target_per_class, batch_size=32, augmenter=None, seed=42):
+    """
+    On-the-fly alternative to `augment_exactly`: a tf.data pipeline that, every
+    epoch, yields each original image once plus freshly augmented copies until
+    each class has `target_per_class` samples. Only the extra copies are
+    augmented, and nothing is materialized up front.
+
+    `y` is one-hot (as returned by `load_Preprcess_data`). Yields batches of
+    (float32 images, one-hot labels).
+    """
+    augmenter = augmenter or build_augmenter(seed)
+    class_ids = np.argmax(y, axis=1)
+
+    def plan(rng):
+        indices, flags = [], []
+        for c in np.unique(class_ids):
+            members = np.flatnonzero(class_ids == c)
+            extra = max(target_per_class - len(members), 0)
+            cycles = math.ceil(extra / len(members)) if extra else 0
+            copies = np.concatenate([rng.permutation(members) for _ in range(cycles)] or [members[:0]])[:extra]
+            indices += [members, copies]
+            flags += [np.zeros(len(members), bool), np.ones(extra, bool)]
+        indices, flags = np.concatenate(indices), np.concatenate(flags)
+        order = rng.permutation(len(indices))
+        return indices[order], flags[order]
+
+    def generate():
+        rng = np.random.default_rng(seed + generate.epoch)
+        generate.epoch += 1
+        indices, flags = plan(rng)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            yield X[batch].astype(np.float32, copy=False), y[batch].astype(np.float32, copy=False), flags[start:start + batch_size]
+    generate.epoch = 0
+
+    def augment_flagged(images, labels, flags):
+        # Augment only the extra copies and scatter them back in place
+        positions = tf.where(flags)
+        augmented = augmenter(tf.gather_nd(images, positions), training=True)
+        return tf.tensor_scatter_nd_update(images, positions, augmented), labels
+
+    ds = tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(
+            tf.TensorSpec((None, *X.shape[1:]), tf.float32),
+            tf.TensorSpec((None, y.shape[1]), tf.float32),
+            tf.TensorSpec((None,), tf.bool),
+        ),
+    )
+    return ds.map(augment_flagged, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def measure_throughput(dataset, max_batches=None):
+    """Iterates a dataset once and prints how many images per second it produced."""
+    count = 0
+    start = time.perf_counter()
+    for i, (images, *_) in enumerate(dataset):
+        count += int(images.shape[0])
+        if max_batches is not None and i + 1 >= max_batches:
+            break
+    elapsed = time.perf_counter() - start
+    rate = count / max(elapsed, 1e-9)
+    print(f"{count} images in {elapsed:.1f}s ({rate:.0f} images/sec)")
+    return rate
@@ -0,0 +1,126 @@
+"""
+Offline job: embeds the labeled reference dataset into an IVF-PQ similarity index for `/similar`.
+
+    cd scripts && python build_embedding_index.py ../app/model/model.keras direct
+
+Every image is passed once through the classifier up to its GlobalAveragePooling2D
+layer. The 512-d embeddings are clustered (IVF) and their residuals
+product-quantized to 64 bytes each; float16 copies are kept for exact re-ranking.
+The embedding sub-model is saved next to the index as embedder.keras, so the API
+embeds queries with exactly the weights the index was built from.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.cluster import KMeans
+from tensorflow.keras.layers import GlobalAveragePooling2D
+from tensorflow.keras.models import Model, load_model
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from data_preprocessing import CLASSES, get_data_path, list_image_files  # noqa: E402
+from preprocessing import decode_many  # noqa: E402
+from cache import model_file_version  # noqa: E402
+from similarity import EMBEDDER, normalize, write_index  # noqa: E402
+
+IMG_SIZE = 128
+
+
+def build_embedder(model):
+    """Sub-model mapping images to the classifier's pooled backbone features."""
+    pooling = next(layer for layer in model.layers if isinstance(layer, GlobalAveragePooling2D))
+    return Model(inputs=model.input, outputs=pooling.output)
+
+
+def embed_files(embedder, paths, image_size=(IMG_SIZE, IMG_SIZE), chunk_size=256, workers=None):
+    """Embeddings for `paths` (float32, N x D) and the indices of the files that failed to decode."""
+    embeddings, failed = [], []
+    for start in tqdm(range(0, len(paths), chunk_size), desc="Embedding images"):
+        chunk = paths[start:start + chunk_size]
+        images, errors = decode_many(chunk, image_size, workers=workers)
+        embeddings.append(np.asarray(embedder.predict_on_batch(images), dtype=np.float32))
+        failed += [start + i for i, _ in errors]
+    return np.concatenate(embeddings), failed
+
+
+def _kmeans(vectors, clusters, seed, max_train=50000):
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), max_train), replace=False)]
+    return KMeans(n_clusters=clusters, n_init=1, max_iter=25, random_state=seed).fit(sample)
+
+
+def build_ivf_pq(vectors, nlist=None, subspaces=64, seed=42):
+    """
+    Trains the coarse quantizer and the residual product quantizer. Returns
+    (centroids, codebooks, assignments, codes).
+    """
+    dim = vectors.shape[1]
+    if dim % subspaces:
+        raise ValueError(f"Embedding size {dim} is not divisible by {subspaces} subspaces.")
+    # ~4 sqrt(N) lists keeps both the coarse scan and each probed list small
+    nlist = nlist or min(len(vectors), int(4 * np.sqrt(len(vectors))))
+
+    coarse = _kmeans(vectors, nlist, seed)
+    assignments = coarse.predict(vectors)
+    residuals = vectors - coarse.cluster_centers_[assignments]
+
+    sub_dim = dim // subspaces
+    codewords = min(256, len(vectors))
+    codebooks = np.zeros((subspaces, codewords, sub_dim), dtype=np.float32)
+    codes = np.zeros((len(vectors), subspaces), dtype=np.uint8)
+    for m in tqdm(range(subspaces), desc="Training product quantizer"):
+        part = residuals[:, m * sub_dim:(m + 1) * sub_dim]
+        quantizer = _kmeans(part, codewords, seed + m)
+        codebooks[m] = quantizer.cluster_centers_
+        codes[:, m] = quantizer.predict(part)
+    return coarse.cluster_centers_.astype(np.float32), codebooks, assignments, codes
+
+
+def build_index(model_path, data_path, output_dir, max_images_per_class=None, subspaces=64, nlist=None,
+                workers=None):
+    model = load_model(model_path)
+    embedder = build_embedder(model)
+    paths, labels = list_image_files(data_path, max_images_per_class)
+
+    start = time.perf_counter()
+    vectors, failed = embed_files(embedder, paths, workers=workers)
+    print(f"Embedded {len(paths)} images in {time.perf_counter() - start:.1f}s")
+    if failed:
+        print(f"Skipping {len(failed)} images that could not be decoded")
+        keep = np.setdiff1d(np.arange(len(paths)), failed)
+        vectors, paths, labels = vectors[keep], paths[keep], labels[keep]
+    vectors = normalize(vectors)
+
+    centroids, codebooks, assignments, codes = build_ivf_pq(vectors, nlist=nlist, subspaces=subspaces)
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+
+    class_names = [name.capitalize() for name, _ in sorted(CLASSES.items(), key=lambda item: item[1])]
+    write_index(
+        output_dir, centroids, codebooks, offsets, codes[order], vectors[order], labels[order],
+        paths[order], class_names, model_version=model_file_version(model_path),
+    )
+    embedder.save(os.path.join(output_dir, EMBEDDER))
+    size_mb = (codes.nbytes + vectors.astype(np.float16).nbytes) / 1e6
+    print(f"Indexed {len(vectors)} images in {len(centroids)} lists ({size_mb:.1f} MB) at {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_path")
+    parser.add_argument("loading_method", choices=["colab", "direct"])
+    parser.add_argument("--output", default="../app/model/similarity_index")
+    parser.add_argument("--max-images-per-class", type=int, default=None)
+    parser.add_argument("--subspaces", type=int, default=64, help="PQ bytes per vector")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of IVF lists (default ~4 sqrt(N))")
+    args = parser.parse_args()
+
+    build_index(
+        args.model_path, get_data_path(args.loading_method), args.output,
+        max_images_per_class=args.max_images_per_class,
+        subspaces=args.subspaces,
+        nlist=args.nlist,
+    )
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from model_loader import open_model  # noqa: E402
+from export_model import load_labeled_sample  # noqa: E402
+
+
+def artifact_size_mb(path):
+    if os.path.isdir(path):
+        total = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    else:
+        total = os.path.getsize(path)
+    return round(total / 1e6, 2)
+
+
+def evaluate_artifact(path, images, labels, batch_size=32, latency_runs=50):
+    """Accuracy, malignant precision/recall and CPU latency of one model artifact."""
+    model = open_model(path)
+    model.predict_on_batch(images[:1])  # warm-up
+
+    start = time.perf_counter()
+    probs = np.concatenate([
+        model.predict_on_batch(images[i:i + batch_size]) for i in range(0, len(images), batch_size)
+    ])
+    throughput = len(images) / (time.perf_counter() - start)
+
+    single = []
+    for i in range(latency_runs):
+        t = time.perf_counter()
+        model.predict_on_batch(images[i % len(images)][np.newaxis])
+        single.append((time.perf_counter() - t) * 1000.0)
+
+    preds = np.argmax(probs, axis=1)
+    true_malignant = np.sum((preds == 1) & (labels == 1))
+    return {
+        "artifact": path,
+        "size_mb": artifact_size_mb(path),
+        "accuracy": round(float(np.mean(preds == labels)), 4),
+        "malignant_recall": round(float(true_malignant / max(np.sum(labels == 1), 1)), 4),
+        "malignant_precision": round(float(true_malignant / max(np.sum(preds == 1), 1)), 4),
+        "latency_p50_ms": round(float(np.percentile(single, 50)), 2),
+        "latency_p99_ms": round(float(np.percentile(single, 99)), 2),
+        "throughput_img_s": round(throughput, 1),
+    }, probs
+
+
+def compare(paths, images, labels, batch_size=32):
+    """Evaluates every artifact; the first one is the reference the others are compared to."""
+    results = []
+    reference = None
+    for path in paths:
+        result, probs = evaluate_artifact(path, images, labels, batch_size)
+        if reference is None:
+            reference = probs
+        result["agreement_with_reference"] = round(
+            float(np.mean(np.argmax(probs, axis=1) == np.argmax(reference, axis=1))), 4
+        )
+        result["max_prob_diff"] = round(float(np.max(np.abs(probs - reference))), 4)
+        results.append(result)
+    return results
+
+
+def print_report(results):
+    columns = ["artifact", "size_mb", "accuracy", "malignant_recall", "malignant_precision",
+               "agreement_with_reference", "latency_p50_ms", "throughput_img_s"]
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "---|" * len(columns))
+    for result in results:
+        print("| " + " | ".join(str(result[c]) for c in columns) + " |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare accuracy and CPU latency of exported model artifacts. "
+                    "The first artifact (usually the .keras model) is the reference.")
+    parser.add_argument("artifacts", nargs="+")
+    parser.add_argument("--data-path", default="raw_data/breast_cancer/BreaKHis_Total_dataset")
+    parser.add_argument("--num-images", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-recall-drop", type=float, default=0.01,
+                        help="Fail if an artifact loses more malignant recall than this vs the reference")
+    parser.add_argument("--output", default="backend_comparison.json")
+    args = parser.parse_args()
+
+    # Held-out test split; int8 models are calibrated on the train split
+    images, labels = load_labeled_sample(args.data_path, args.num_images, seed=args.seed, split="test")
+    results = compare(args.artifacts, images, labels)
+    print_report(results)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    reference_recall = results[0]["malignant_recall"]
+    failed = [r["artifact"] for r in results[1:] if reference_recall - r["malignant_recall"] > args.max_recall_drop]
+    if failed:
+        print(f"Malignant recall dropped by more than {args.max_recall_drop} for: {', '.join(failed)}")
+        sys.exit(1)
@@ -1,12 +1,33 @@
 import os
-from tqdm import tqdm
+import sys
 from tensorflow.keras.utils import to_categorical
-from PIL import Image
 import numpy as np
 from sklearn.model_selection import train_test_split
 import tensorflow as tf
 
-def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_class =None, target_per_class=10000):
+from augmentation import augment_exactly, build_augmenter, make_oversampled_dataset
+
+# The decode kernel lives with the API so training and serving preprocess identically
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from preprocessing import decode_many  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CLASSES = {'benign': 0, 'malignant': 1}
+
+
+def get_data_path(loading_method):
+    """Path to the dataset depending on the running environment ('colab' or 'direct')."""
+    if loading_method == 'colab':
+        # Path for Google Colab
+        return "/content/drive/MyDrive/breast_project/breast_cancer_dataset"
+    elif loading_method == 'direct':
+        # Local or direct path
+        return "raw_data/breast_cancer/BreaKHis_Total_dataset"
+    raise ValueError("loading_method must be either 'colab' or 'direct'.")
+
+
+def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_class =None, target_per_class=10000,
+                        augment_on_the_fly=False, seed=42, batch_size=32, num_workers=None):
     """
     Loads and preprocesses a breast cancer histopathology image dataset for CNN models.
 
@@ -17,6 +38,10 @@ def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_cl
         - One-hot encodes labels
         - Shuffles and splits into train/val/test sets
 
+    With `augment_on_the_fly=True`, only the original images are split, and the
+    training set is returned as a tf.data.Dataset that draws fresh augmented
+    copies every epoch (see `augmentation.make_oversampled_dataset`).
+
     Parameters
     ----------
     loading_method : str
@@ -27,11 +52,19 @@ def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_cl
         Maximum number of images to load per class. Useful for limiting dataset size during testing.
     target_per_class : int
         Number of images to have per class after augmentation.
+    augment_on_the_fly : bool
+        Augment per epoch instead of materializing augmented images up front.
+    seed : int
+        Seed for the augmentation and the shuffle, for reproducible datasets.
+    batch_size : int
+        Batch size of the training dataset when `augment_on_the_fly` is True.
+    num_workers : int or None
+        Processes used to decode images (default: one per CPU, 0 = no pool).
 
     Returns
     -------
-    X_train : np.ndarray
-    y_train : np.ndarray
+    X_train : np.ndarray, or tf.data.Dataset of (images, labels) if `augment_on_the_fly`
+    y_train : np.ndarray, or None if `augment_on_the_fly`
     X_val : np.ndarray
     y_val : np.ndarray
     X_test : np.ndarray
@@ -39,29 +72,16 @@ def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_cl
     """
 
     # Select path to dataset depending on running environment
-    if loading_method == 'colab':
-        # Path for Google Colab
-        data_path = "/content/drive/MyDrive/breast_project/breast_cancer_dataset"
-    elif loading_method == 'direct':
-        # Local or direct path
-        data_path = "raw_data/breast_cancer/BreaKHis_Total_dataset"
-    else:
-        raise ValueError("loading_method must be either 'colab' or 'direct'.")
+    data_path = get_data_path(loading_method)
 
     imgs = []    # to store image arrays
     labels = []  # to store corresponding class labels
 
     # Dictionary mapping class names to numeric labels
-    classes = {'benign': 0, 'malignant': 1}
+    classes = CLASSES
 
     # Define augmentation pipeline
-    augmenter = tf.keras.Sequential([
-        tf.keras.layers.RandomFlip("horizontal_and_vertical"),
-        tf.keras.layers.RandomRotation(0.2),
-        tf.keras.layers.RandomZoom(0.1),
-        tf.keras.layers.RandomContrast(0.2),
-        tf.keras.layers.Lambda(lambda x: tf.clip_by_value(x + tf.random.uniform([], -0.1, 0.1), 0.0, 1.0)),  # brightness
-    ])
+    augmenter = build_augmenter(seed)
 
     # Loop through each class (benign or malignant)
     for cl, label in classes.items():
@@ -70,70 +90,165 @@ def load_Preprcess_data(loading_method, image_size=(128, 128), max_images_per_cl
         # List all image filenames in the class directory
         images_path = [
             f for f in os.listdir(class_dir)
-            if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+            if f.lower().endswith(IMAGE_EXTENSIONS)
         ]
 
         # If max_images_per_class is set, limit how many images to load
         if max_images_per_class:
             images_path = images_path[:max_images_per_class]
 
-        original_images = []
-
-        # Iterate over each image file in this class
-        for img_name in tqdm(images_path, desc=f"Loading {cl} images"):
-            img_path = os.path.join(class_dir, img_name)
-
-            try:
-                img = Image.open(img_path).convert('RGB').resize(image_size)
-                original_images.append(np.array(img) / 255.0)
-            except Exception as e:
-                print(f"Error loading {img_path}: {e}")
-
+        # Decode every image of this class in parallel, straight into one float32 array
+        print(f"Loading {len(images_path)} {cl} images...")
+        img_paths = [os.path.join(class_dir, img_name) for img_name in images_path]
+        original_images, errors = decode_many(img_paths, image_size, workers=num_workers)
+        for index, error in errors:
+            print(f"Error loading {img_paths[index]}: {error}")
+        if errors:
+            original_images = np.delete(original_images, [index for index, _ in errors], axis=0)
+        class_imgs = [original_images]
 
         # Augment until we reach target_per_class
         current_count = len(original_images)
-        augmented_images = []
-
-        if current_count < target_per_class:
+        if current_count < target_per_class and not augment_on_the_fly:
             needed = target_per_class - current_count
-            print(f"Augmenting {classes}: Need {needed} more images...")
-
-            # Convert to tensor
-            base_imgs = tf.convert_to_tensor(original_images)
-            base_imgs = tf.image.resize(base_imgs, image_size)
-
-            i = 0
-            while len(augmented_images) < needed:
-                batch = augmenter(base_imgs, training=True).numpy()
-                for idx, img in enumerate(batch):
-                    augmented_images.append(img)
-
-                    # Save the augmented image
-                    #save_augmented_image(img, class_dir, cl, len(original_images) + len(augmented_images))
-
-                    if len(augmented_images) >= needed:
-                        break
-
+            print(f"Augmenting {cl}: Need {needed} more images...")
+            class_imgs.append(augment_exactly(original_images, needed, augmenter, seed=seed + label))
 
         # Combine original and augmented
-        total_class_imgs = np.concatenate([original_images, augmented_images], axis=0)
-        total_class_labels = np.full((target_per_class,), label)
+        total_class_imgs = np.concatenate(class_imgs, axis=0)
+        total_class_labels = np.full((len(total_class_imgs),), label)
 
-        imgs.extend(total_class_imgs)
-        labels.extend(total_class_labels)
+        imgs.append(total_class_imgs)
+        labels.append(total_class_labels)
 
     # Convert to arrays
-    X = np.array(imgs, dtype=np.float32)
-    y = to_categorical(np.array(labels), num_classes=2)
+    X = np.concatenate(imgs, axis=0)
+    y = to_categorical(np.concatenate(labels), num_classes=2)
 
     # Shuffle
-    indices = np.random.permutation(len(X))
+    indices = np.random.default_rng(seed).permutation(len(X))
     X, y = X[indices], y[indices]
 
     # Split
     X_temp, X_test, y_temp, y_test = train_test_split(X, y, test_size=1/6, stratify=y, random_state=42)
     X_train, X_val, y_train, y_val = train_test_split(X_temp, y_temp, test_size=0.2, stratify=np.argmax(y_temp, axis=1), random_state=42)
 
+    if augment_on_the_fly:
+        # Same share of target_per_class that the training split gets when augmenting up front
+        train_target = round(target_per_class * (1 - 1/6) * (1 - 0.2))
+        X_train = make_oversampled_dataset(X_train, y_train, train_target, batch_size, augmenter, seed=seed)
+        y_train = None
+
     return X_train, y_train, X_val, y_val, X_test, y_test, 2
 
-X_train, y_train, X_val, y_val, X_test, y_test, num_classes = load_Preprcess_data('colab')
+
+def list_image_files(data_path, max_images_per_class=None):
+    """Returns (paths, labels) for every image in the benign/ and malignant/ folders."""
+    paths, labels = [], []
+    for cl, label in CLASSES.items():
+        class_dir = os.path.join(data_path, cl)
+        images_path = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if max_images_per_class:
+            images_path = images_path[:max_images_per_class]
+        paths += [os.path.join(class_dir, f) for f in images_path]
+        labels += [label] * len(images_path)
+    return np.array(paths), np.array(labels)
+
+
+def split_file_list(paths, labels, test_size=1/6, val_size=0.2, random_state=42):
+    """
+    Stratified train/val/test split of file paths, with the same proportions
+    as `load_Preprcess_data`. Only strings are shuffled, never pixel arrays.
+    """
+    paths_temp, paths_test, labels_temp, labels_test = train_test_split(
+        paths, labels, test_size=test_size, stratify=labels, random_state=random_state)
+    paths_train, paths_val, labels_train, labels_val = train_test_split(
+        paths_temp, labels_temp, test_size=val_size, stratify=labels_temp, random_state=random_state)
+    return (paths_train, labels_train), (paths_val, labels_val), (paths_test, labels_test)
+
+
+def decode_image(path, image_size):
+    """Reads and resizes one image file to a uint8 (H, W, 3) tensor."""
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    # Antialiased bicubic, to match PIL's Image.resize used by the API
+    image = tf.image.resize(image, image_size, method="bicubic", antialias=True)
+    return tf.cast(tf.round(tf.clip_by_value(image, 0.0, 255.0)), tf.uint8)
+
+
+def make_dataset(paths, labels, image_size=(128, 128), batch_size=32, training=False,
+                 augment=True, cache=True, samples_per_epoch=None, seed=42):
+    """
+    Streaming tf.data pipeline over a list of image files.
+
+    Images are decoded in parallel. With `cache=True` the resized uint8 images
+    are kept in memory after the first epoch (a quarter of the size of float32);
+    with a string, they are cached to files with that prefix instead.
+
+    For training, each class is streamed separately and sampled 50/50, which
+    replaces oversampling by augmentation: an epoch draws `samples_per_epoch`
+    images (default: twice the largest class), augmented on the fly per batch.
+
+    Yields batches of (float32 images in [0, 1], one-hot labels).
+    """
+    autotune = tf.data.AUTOTUNE
+    prefix = cache if isinstance(cache, str) else ""
+
+    def from_files(file_paths, file_labels, cache_file):
+        ds = tf.data.Dataset.from_tensor_slices((file_paths, file_labels))
+        ds = ds.map(lambda p, l: (decode_image(p, image_size), l), num_parallel_calls=autotune)
+        if cache:
+            ds = ds.cache(cache_file)
+        return ds
+
+    if training:
+        per_class = []
+        for label in CLASSES.values():
+            mask = labels == label
+            class_ds = from_files(paths[mask], labels[mask], f"{prefix}_{label}" if prefix else "")
+            per_class.append(class_ds.shuffle(int(mask.sum()), seed=seed).repeat())
+        if samples_per_epoch is None:
+            samples_per_epoch = len(CLASSES) * max(int(np.sum(labels == l)) for l in CLASSES.values())
+        ds = tf.data.Dataset.sample_from_datasets(
+            per_class, seed=seed, rerandomize_each_iteration=True).take(samples_per_epoch)
+    else:
+        ds = from_files(paths, labels, prefix)
+
+    ds = ds.batch(batch_size)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, tf.one_hot(y, len(CLASSES))),
+                num_parallel_calls=autotune)
+    if training and augment:
+        augmenter = build_augmenter()
+        ds = ds.map(lambda x, y: (augmenter(x, training=True), y), num_parallel_calls=autotune)
+    return ds.prefetch(autotune)
+
+
+def load_datasets(loading_method, image_size=(128, 128), batch_size=32, max_images_per_class=None,
+                  augment=True, cache=True, samples_per_epoch=None):
+    """
+    Streaming counterpart of `load_Preprcess_data`. The stratified split is done
+    on the file list, not on pixel arrays, and validation and test sets contain
+    original images only. `cache` is passed to `make_dataset` for the training
+    and validation sets; the test set is read once and never cached.
+
+    Returns
+    -------
+    train_ds : tf.data.Dataset
+    val_ds : tf.data.Dataset
+    test_ds : tf.data.Dataset
+    num_classes : int
+    """
+    paths, labels = list_image_files(get_data_path(loading_method), max_images_per_class)
+    (p_train, l_train), (p_val, l_val), (p_test, l_test) = split_file_list(paths, labels)
+
+    def cache_for(split):
+        return f"{cache}_{split}" if isinstance(cache, str) else cache
+
+    train_ds = make_dataset(p_train, l_train, image_size, batch_size, training=True, augment=augment,
+                            cache=cache_for("train"), samples_per_epoch=samples_per_epoch)
+    val_ds = make_dataset(p_val, l_val, image_size, batch_size, cache=cache_for("val"))
+    test_ds = make_dataset(p_test, l_test, image_size, batch_size, cache=False)
+    return train_ds, val_ds, test_ds, len(CLASSES)
+
+
+if __name__ == "__main__":
+    X_train, y_train, X_val, y_val, X_test, y_test, num_classes = load_Preprcess_data('colab')
@@ -1,9 +1,12 @@
+import time
+
 import matplotlib.pyplot as plt
-from sklearn.metrics import confusion_matrix, classification_report
 import seaborn as sns
 import numpy as np
 import tensorflow as tf
 
+CLASS_NAMES = ['Benign', 'Malignant']
+
 def plot_training_curves(history):
     plt.figure(figsize=(10, 5))
     plt.plot(history.history['accuracy'], label='Training Accuracy')
@@ -16,20 +19,173 @@ def plot_training_curves(history):
     plt.tight_layout()
     plt.savefig('assets/training_curve.png')  # for Streamlit app
 
-def evaluate_model(model, X_test, y_test):
-    y_pred_probs = model.predict(X_test)
-    y_pred = np.argmax(y_pred_probs, axis=1)
-    y_true = np.argmax(y_test, axis=1)
 
+class StreamingEvaluator:
+    """
+    Binary classification metrics accumulated batch by batch, in constant memory.
+
+    Keeps the confusion matrix, per-class histograms of the malignant
+    probability (for ROC-AUC and the ROC curve, exact up to `score_bins`
+    resolution) and calibration bins (count, summed confidence, positives).
+    No individual prediction is stored.
+    """
+
+    def __init__(self, score_bins=10000, calibration_bins=10):
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+        self.score_hist = np.zeros((2, score_bins), dtype=np.int64)
+        self.calibration_bins = calibration_bins
+        self.bin_count = np.zeros(calibration_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(calibration_bins)
+        self.bin_positives = np.zeros(calibration_bins)
+
+    @property
+    def count(self):
+        return int(self.confusion.sum())
+
+    def update(self, probs, labels):
+        """`probs` is (N, 2) softmax output; `labels` are one-hot (N, 2) or class ids (N,)."""
+        probs = np.asarray(probs, dtype=np.float64)
+        labels = np.asarray(labels)
+        y_true = np.argmax(labels, axis=1) if labels.ndim == 2 else labels.astype(int)
+        y_pred = np.argmax(probs, axis=1)
+        np.add.at(self.confusion, (y_true, y_pred), 1)
+
+        score = probs[:, 1]
+        bins = self.score_hist.shape[1]
+        score_idx = np.minimum((score * bins).astype(int), bins - 1)
+        np.add.at(self.score_hist, (y_true, score_idx), 1)
+
+        cal_idx = np.minimum((score * self.calibration_bins).astype(int), self.calibration_bins - 1)
+        self.bin_count += np.bincount(cal_idx, minlength=self.calibration_bins)
+        self.bin_confidence += np.bincount(cal_idx, weights=score, minlength=self.calibration_bins)
+        self.bin_positives += np.bincount(cal_idx, weights=y_true, minlength=self.calibration_bins)
+
+    def roc_curve(self):
+        # Sweep the threshold from the highest score bin down
+        positives = np.cumsum(self.score_hist[1][::-1])
+        negatives = np.cumsum(self.score_hist[0][::-1])
+        tpr = np.concatenate([[0.0], positives / max(positives[-1], 1)])
+        fpr = np.concatenate([[0.0], negatives / max(negatives[-1], 1)])
+        return fpr, tpr
+
+    def roc_auc(self):
+        if not self.score_hist[0].any() or not self.score_hist[1].any():
+            return float('nan')
+        fpr, tpr = self.roc_curve()
+        # Trapezoids: scores that share a bin count as ties
+        return float(np.sum((fpr[1:] - fpr[:-1]) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def calibration(self):
+        """(mean predicted malignant probability, observed malignant rate, count) per non-empty bin."""
+        filled = self.bin_count > 0
+        return (self.bin_confidence[filled] / self.bin_count[filled],
+                self.bin_positives[filled] / self.bin_count[filled],
+                self.bin_count[filled])
+
+    def expected_calibration_error(self):
+        confidence, observed, count = self.calibration()
+        return float(np.sum(count * np.abs(confidence - observed)) / max(count.sum(), 1))
+
+    def report(self):
+        metrics = {"count": self.count, "accuracy": float(np.trace(self.confusion) / max(self.count, 1))}
+        for c, name in enumerate(CLASS_NAMES):
+            predicted, actual = self.confusion[:, c].sum(), self.confusion[c].sum()
+            precision = self.confusion[c, c] / predicted if predicted else 0.0
+            recall = self.confusion[c, c] / actual if actual else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            metrics[name] = {"precision": float(precision), "recall": float(recall), "f1": float(f1),
+                             "support": int(actual)}
+        metrics["roc_auc"] = self.roc_auc()
+        metrics["ece"] = self.expected_calibration_error()
+        metrics["confusion_matrix"] = self.confusion.tolist()
+        return metrics
+
+
+def iter_batches(X_test, y_test=None, batch_size=64):
+    """(images, labels) batches from arrays, a tf.data dataset or any iterable of batches."""
+    if y_test is not None:
+        for start in range(0, len(X_test), batch_size):
+            yield X_test[start:start + batch_size], y_test[start:start + batch_size]
+    elif isinstance(X_test, tf.data.Dataset):
+        for images, labels in X_test.as_numpy_iterator():
+            yield images, labels
+    else:
+        yield from X_test
+
+
+def print_report(metrics):
+    print(f"{'':>12} {'precision':>10} {'recall':>10} {'f1-score':>10} {'support':>10}")
+    for name in CLASS_NAMES:
+        m = metrics[name]
+        print(f"{name:>12} {m['precision']:>10.2f} {m['recall']:>10.2f} {m['f1']:>10.2f} {m['support']:>10}")
+    print(f"\n{'accuracy':>12} {metrics['accuracy']:>32.2f} {metrics['count']:>10}")
+    print(f"{'ROC-AUC':>12} {metrics['roc_auc']:>32.4f}")
+    print(f"{'ECE':>12} {metrics['ece']:>32.4f}")
+
+
+def plot_evaluation(evaluator, assets_dir='assets'):
     # Confusion Matrix
-    cm = confusion_matrix(y_true, y_pred)
     plt.figure(figsize=(6, 5))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Purples', xticklabels=['Benign', 'Malignant'], yticklabels=['Benign', 'Malignant'])
+    sns.heatmap(evaluator.confusion, annot=True, fmt='d', cmap='Purples', xticklabels=CLASS_NAMES, yticklabels=CLASS_NAMES)
     plt.xlabel('Predicted label')
     plt.ylabel('True label')
     plt.title('Confusion Matrix')
     plt.tight_layout()
-    plt.savefig('assets/confusion_matrix.png')  # for Streamlit app
+    plt.savefig(f'{assets_dir}/confusion_matrix.png')  # for Streamlit app
+    plt.close()
+
+    # ROC curve
+    fpr, tpr = evaluator.roc_curve()
+    plt.figure(figsize=(6, 5))
+    plt.plot(fpr, tpr, color='purple', label=f'ROC-AUC = {evaluator.roc_auc():.3f}')
+    plt.plot([0, 1], [0, 1], linestyle='--', color='grey')
+    plt.xlabel('False positive rate')
+    plt.ylabel('True positive rate (malignant recall)')
+    plt.title('ROC Curve')
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(f'{assets_dir}/roc_curve.png')
+    plt.close()
+
+    # Reliability diagram
+    confidence, observed, _ = evaluator.calibration()
+    plt.figure(figsize=(6, 5))
+    plt.plot([0, 1], [0, 1], linestyle='--', color='grey', label='Perfect calibration')
+    plt.plot(confidence, observed, marker='o', color='purple', label=f'Model (ECE = {evaluator.expected_calibration_error():.3f})')
+    plt.xlabel('Predicted malignant probability')
+    plt.ylabel('Observed malignant rate')
+    plt.title('Calibration')
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(f'{assets_dir}/calibration.png')
+    plt.close()
+
+
+def evaluate_model(model, X_test, y_test=None, batch_size=64, log_every=20, assets_dir='assets'):
+    """
+    Evaluates `model` batch by batch and writes the confusion matrix, ROC and
+    calibration plots to `assets_dir`.
+
+    `X_test` can be an array (with `y_test`), a tf.data dataset of (images,
+    labels) batches, or any iterable of such batches, e.g. a generator over a
+    dataset larger than RAM. Metrics are accumulated per batch and running
+    throughput is printed every `log_every` batches. Returns the metrics dict.
+    """
+    evaluator = StreamingEvaluator()
+    start = time.perf_counter()
+    for step, (images, labels) in enumerate(iter_batches(X_test, y_test, batch_size), start=1):
+        evaluator.update(np.asarray(model.predict_on_batch(images)), labels)
+        if step % log_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{evaluator.count} images evaluated ({evaluator.count / elapsed:.0f} images/sec), "
+                  f"running accuracy {np.trace(evaluator.confusion) / evaluator.count:.3f}")
+    elapsed = time.perf_counter() - start
 
-    # Classification Report
-    print(classification_report(y_true, y_pred, target_names=['Benign', 'Malignant']))
+    metrics = evaluator.report()
+    metrics["images_per_sec"] = evaluator.count / max(elapsed, 1e-9)
+    print_report(metrics)
+    print(f"Evaluated {evaluator.count} images in {elapsed:.1f}s ({metrics['images_per_sec']:.0f} images/sec)")
+    plot_evaluation(evaluator, assets_dir)
+    return metrics
@@ -0,0 +1,158 @@
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from preprocessing import decode_many  # noqa: E402
+from data_preprocessing import list_image_files, split_file_list  # noqa: E402
+
+IMG_SIZE = 128
+
+
+def load_labeled_sample(data_path, num_images=200, image_size=(IMG_SIZE, IMG_SIZE), seed=42, split="train"):
+    """
+    Samples images evenly from both classes of one split ("train", "val" or
+    "test") of the dataset, and preprocesses them the way the API does. The
+    split is the same as in training, so calibrating on "train" never touches
+    the images a model is evaluated on. Returns (images, labels) with labels
+    0 = benign, 1 = malignant.
+    """
+    splits = dict(zip(("train", "val", "test"), split_file_list(*list_image_files(data_path))))
+    split_paths, split_labels = splits[split]
+    rng = random.Random(seed)
+    paths, labels = [], []
+    for label in (0, 1):
+        files = sorted(split_paths[split_labels == label])
+        chosen = rng.sample(files, min(num_images // 2, len(files)))
+        paths += [str(path) for path in chosen]
+        labels += [label] * len(chosen)
+
+    images, errors = decode_many(paths, image_size)
+    if errors:
+        raise ValueError(f"Could not decode {paths[errors[0][0]]}: {errors[0][1]}")
+    return images, np.array(labels)
+
+
+def load_calibration_images(data_path, num_images=200, image_size=(IMG_SIZE, IMG_SIZE), seed=42):
+    """Training-split images for post-training quantization; labels are not needed."""
+    return load_labeled_sample(data_path, num_images, image_size, seed, split="train")[0]
+
+
+def export_saved_model(model, output_dir):
+    """Exports an inference-only SavedModel that the API can load without Keras."""
+    model.export(output_dir, format="tf_saved_model")
+    return output_dir
+
+
+def export_tflite(model, output_path, saved_model_dir=None, quantize="none", calibration_images=None):
+    """
+    Converts the model to a .tflite flatbuffer, going through a SavedModel.
+
+    quantize:
+        "none"    - float32 weights and activations
+        "dynamic" - int8 weights, float activations (no calibration needed)
+        "int8"    - int8 weights and activations, calibrated on `calibration_images`;
+                    inputs and outputs stay float32 so the API does not change
+    """
+    saved_model_dir = saved_model_dir or os.path.splitext(output_path)[0] + "_savedmodel"
+    if not os.path.isdir(saved_model_dir):
+        export_saved_model(model, saved_model_dir)
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if quantize in ("dynamic", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "int8":
+        if calibration_images is None:
+            raise ValueError("int8 quantization needs calibration_images.")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    return output_path
+
+
+def export_onnx(model, output_path, quantize="none", calibration_images=None):
+    """
+    Exports the model to ONNX (needs `tf2onnx`) and optionally quantizes it with
+    ONNX Runtime: "dynamic" quantizes weights only, "int8" also calibrates the
+    activations on `calibration_images` (static QDQ quantization).
+    """
+    float_path = output_path if quantize == "none" else os.path.splitext(output_path)[0] + "_float.onnx"
+    # Keras only exports models that have been called at least once
+    model(np.zeros((1, *model.input_shape[1:]), dtype=np.float32))
+    model.export(float_path, format="onnx")
+    if quantize == "none":
+        return output_path
+
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+
+    if quantize == "dynamic":
+        quantize_dynamic(float_path, output_path, weight_type=QuantType.QInt8)
+        return output_path
+
+    if calibration_images is None:
+        raise ValueError("int8 quantization needs calibration_images.")
+
+    import onnxruntime
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    # Shape inference and graph cleanup make static quantization more accurate
+    prepared_path = os.path.splitext(output_path)[0] + "_prepared.onnx"
+    quant_pre_process(float_path, prepared_path, skip_symbolic_shape=True)
+    input_name = onnxruntime.InferenceSession(prepared_path).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration_images)
+
+        def get_next(self):
+            image = next(self.images, None)
+            return None if image is None else {input_name: image[np.newaxis]}
+
+    quantize_static(
+        prepared_path, output_path, Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the trained .keras model for faster serving.")
+    parser.add_argument("model_path", help="Path to the trained .keras model")
+    parser.add_argument("--format", choices=["savedmodel", "tflite", "onnx"], default="savedmodel")
+    parser.add_argument("--quantize", choices=["none", "dynamic", "int8"], default="none")
+    parser.add_argument("--data-path", default="raw_data/breast_cancer/BreaKHis_Total_dataset",
+                        help="Dataset with benign/ and malignant/ folders, used to calibrate int8")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--output", required=True, help="Output directory (savedmodel) or .tflite/.onnx file")
+    args = parser.parse_args()
+
+    model = load_model(args.model_path)
+    calibration_images = None
+    if args.quantize == "int8":
+        calibration_images = load_calibration_images(args.data_path, args.calibration_images)
+
+    if args.format == "savedmodel":
+        export_saved_model(model, args.output)
+    elif args.format == "tflite":
+        export_tflite(model, args.output, quantize=args.quantize, calibration_images=calibration_images)
+    else:
+        export_onnx(model, args.output, quantize=args.quantize, calibration_images=calibration_images)
+    print(f"Exported {args.model_path} -> {args.output}")
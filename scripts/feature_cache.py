@@ -0,0 +1,231 @@
+"""
+Frozen-backbone feature cache: trains block5 and the classifier head from cached block4 activations.
+
+    python feature_cache.py build ../data_cache --output ../feature_cache --copies 4
+    python feature_cache.py train ../feature_cache --epochs 30 --output best_model.keras
+
+In `build_vgg16_model_unfreeze_2`, blocks 1-4 of VGG16 are frozen, yet every
+epoch runs each image through them again. `build` runs that frozen prefix once
+over the shard cache (see shard_cache.py) and stores the block4_pool output
+(8x8x512 for 128x128 inputs) as float16 .npy files that are memory-mapped at
+training time.
+
+Augmentations cannot be applied to cached features, so `build` also stores
+`--copies` augmented versions of every training image, made once with the
+usual augmenter before the prefix. Each epoch then shows every training image
+as one of its versions, picked at random. `train` fits only block5 and the
+head, starting from the same weights as the full model would, and saves a
+complete model that the API loads like any other.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import VGG16
+from tensorflow.keras.layers import Conv2D, Input, MaxPooling2D
+from tensorflow.keras.models import Model
+from tqdm import tqdm
+
+from augmentation import build_augmenter
+from shard_cache import load_manifest, load_split
+from train_model import (
+    IMG_SIZE, LEARNING_RATE, ThroughputLogger, add_classifier_head, build_vgg16_model_unfreeze_2, compile_classifier,
+)
+
+META = "meta.json"
+PREFIX_WEIGHTS = "prefix.weights.h5"
+BLOCK5 = ("block5_conv1", "block5_conv2", "block5_conv3")
+
+
+def build_prefix(img_size=IMG_SIZE, weights='imagenet'):
+    """The frozen part of the network: VGG16 up to block4_pool, and the block5 weights to start from."""
+    base_model = VGG16(include_top=False, weights=weights, input_tensor=Input(shape=(img_size, img_size, 3)))
+    prefix = Model(inputs=base_model.input, outputs=base_model.get_layer("block4_pool").output)
+    block5 = {name: base_model.get_layer(name).get_weights() for name in BLOCK5}
+    return prefix, block5
+
+
+def build_suffix(feature_shape, block5_weights=None, learning_rate=LEARNING_RATE):
+    """Block5 and the classifier head, taking cached block4 features as input."""
+    inputs = Input(shape=feature_shape)
+    x = inputs
+    for name in BLOCK5:
+        x = Conv2D(512, (3, 3), activation='relu', padding='same', name=name)(x)
+    x = MaxPooling2D((2, 2), strides=(2, 2), name="block5_pool")(x)
+    model = Model(inputs=inputs, outputs=add_classifier_head(x))
+    if block5_weights is not None:
+        for name in BLOCK5:
+            model.get_layer(name).set_weights(block5_weights[name])
+    compile_classifier(model, learning_rate)
+    return model
+
+
+def _layers_after(model, name):
+    layers = model.layers
+    index = next(i for i, layer in enumerate(layers) if layer.name == name)
+    return layers[index + 1:]
+
+
+def assemble_model(prefix, suffix, img_size=IMG_SIZE):
+    """The full `build_vgg16_model_unfreeze_2` model, with the prefix and trained suffix weights."""
+    model = build_vgg16_model_unfreeze_2(img_size, weights=None)
+    for layer in prefix.layers:
+        if layer.weights:
+            model.get_layer(layer.name).set_weights(layer.get_weights())
+    for name in BLOCK5:
+        model.get_layer(name).set_weights(suffix.get_layer(name).get_weights())
+    for target, source in zip(_layers_after(model, "block5_pool"), _layers_after(suffix, "block5_pool")):
+        target.set_weights(source.get_weights())
+    return model
+
+
+def _write_features(prefix, parts, path, versions, augmenter=None, batch_size=64):
+    """
+    Runs `prefix` over the uint8 (images, labels) `parts` and writes a float16
+    memmap of shape (N, versions, H, W, C): version 0 is the original image,
+    the others augmented copies. Returns the labels.
+    """
+    count = sum(len(labels) for _, labels in parts)
+    feature_shape = tuple(prefix.output.shape[1:])
+    features = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=(count, versions, *feature_shape))
+    labels = np.concatenate([part_labels for _, part_labels in parts])
+
+    row = 0
+    with tqdm(total=count * versions, desc=f"Caching {os.path.basename(path)}") as progress:
+        for images, _ in parts:
+            for start in range(0, len(images), batch_size):
+                batch = np.asarray(images[start:start + batch_size], dtype=np.float32) / 255.0
+                for version in range(versions):
+                    inputs = batch if version == 0 else augmenter(batch, training=True)
+                    features[row:row + len(batch), version] = prefix.predict_on_batch(inputs)
+                    progress.update(len(batch))
+                row += len(batch)
+    features.flush()
+    del features
+    return labels
+
+
+def build_feature_cache(shard_dir, output_dir, copies=4, weights='imagenet', seed=42, batch_size=64):
+    """
+    Caches block4 features for the train split (original + `copies` augmented
+    versions per image) and the val and test splits (originals only).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(shard_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No shard cache in {shard_dir}; run shard_cache.py first.")
+    img_size = manifest["image_size"][0]
+    prefix, block5 = build_prefix(img_size, weights)
+    augmenter = build_augmenter(seed)
+
+    counts = {}
+    for split in ("train", "val", "test"):
+        versions = copies + 1 if split == "train" else 1
+        labels = _write_features(prefix, load_split(shard_dir, split), os.path.join(output_dir, f"features_{split}.npy"),
+                                 versions, augmenter, batch_size)
+        np.save(os.path.join(output_dir, f"labels_{split}.npy"), labels)
+        counts[split] = len(labels)
+
+    # The prefix and block5 starting weights, so `train` rebuilds exactly this network
+    prefix.save_weights(os.path.join(output_dir, PREFIX_WEIGHTS))
+    np.savez(os.path.join(output_dir, "block5_init.npz"),
+             **{f"{name}_{i}": w for name in BLOCK5 for i, w in enumerate(block5[name])})
+    with open(os.path.join(output_dir, META), "w") as f:
+        json.dump({"image_size": img_size, "copies": copies, "weights": weights, "counts": counts}, f)
+    return counts
+
+
+def make_feature_dataset(cache_dir, split, batch_size=32, training=False, seed=42):
+    """
+    Batches of (float32 features, one-hot labels) read from the memory-mapped
+    cache. For training, each epoch is reshuffled and every image appears as
+    one randomly chosen version: the original or one of its augmented copies.
+    """
+    features = np.load(os.path.join(cache_dir, f"features_{split}.npy"), mmap_mode="r")
+    labels = np.load(os.path.join(cache_dir, f"labels_{split}.npy"))
+    count, versions = features.shape[:2]
+
+    def generate():
+        rng = np.random.default_rng(seed + generate.epoch)
+        generate.epoch += 1
+        order = rng.permutation(count) if training else np.arange(count)
+        for start in range(0, count, batch_size):
+            # Sorted rows keep the memmap reads mostly sequential
+            rows = np.sort(order[start:start + batch_size])
+            picked = rng.integers(0, versions, len(rows)) if training else np.zeros(len(rows), dtype=int)
+            yield features[rows, picked].astype(np.float32), labels[rows]
+    generate.epoch = 0
+
+    ds = tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(
+            tf.TensorSpec((None, *features.shape[2:]), tf.float32),
+            tf.TensorSpec((None,), labels.dtype),
+        ),
+    )
+    ds = ds.map(lambda x, y: (x, tf.one_hot(y, 2)), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def train_from_cache(cache_dir, output_path="best_model.keras", epochs=30, batch_size=32,
+                     learning_rate=LEARNING_RATE, seed=42):
+    """
+    Trains block5 and the head on cached features and saves the complete model
+    to `output_path`. Returns (model, history).
+    """
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+    with open(os.path.join(cache_dir, META)) as f:
+        meta = json.load(f)
+    prefix, _ = build_prefix(meta["image_size"], weights=None)
+    prefix.load_weights(os.path.join(cache_dir, PREFIX_WEIGHTS))
+    init = np.load(os.path.join(cache_dir, "block5_init.npz"))
+    block5 = {name: [init[f"{name}_{i}"] for i in range(2)] for name in BLOCK5}
+
+    train_ds = make_feature_dataset(cache_dir, "train", batch_size, training=True, seed=seed)
+    val_ds = make_feature_dataset(cache_dir, "val", batch_size)
+    suffix = build_suffix(tuple(prefix.output.shape[1:]), block5, learning_rate)
+
+    history = suffix.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=[
+            ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, verbose=1),
+            EarlyStopping(monitor='val_loss', patience=6, restore_best_weights=True),
+            ThroughputLogger(meta["counts"]["train"]),
+        ],
+    )
+    model = assemble_model(prefix, suffix, meta["image_size"])
+    model.save(output_path)
+    print(f"Saved the full model to {output_path}")
+    return model, history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Run the frozen prefix once and cache its features")
+    build.add_argument("shard_dir", help="Output directory of shard_cache.py")
+    build.add_argument("--output", default="../feature_cache")
+    build.add_argument("--copies", type=int, default=4, help="Augmented versions cached per training image")
+    build.add_argument("--random-init", action="store_true", help="Random instead of ImageNet weights")
+
+    train = commands.add_parser("train", help="Train block5 and the head from cached features")
+    train.add_argument("cache_dir")
+    train.add_argument("--output", default="best_model.keras")
+    train.add_argument("--epochs", type=int, default=30)
+    train.add_argument("--batch-size", type=int, default=32)
+    train.add_argument("--learning-rate", type=float, default=LEARNING_RATE)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        counts = build_feature_cache(args.shard_dir, args.output, copies=args.copies,
+                                     weights=None if args.random_init else 'imagenet')
+        print(f"Cached features in {args.output}: {counts}")
+    else:
+        train_from_cache(args.cache_dir, args.output, epochs=args.epochs, batch_size=args.batch_size,
+                         learning_rate=args.learning_rate)
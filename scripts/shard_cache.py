@@ -0,0 +1,228 @@
+"""
+One-time preprocessing of the dataset into uint8 shards for fast repeat training runs.
+
+    python scripts/shard_cache.py direct --output data_cache
+
+Resized images are written as .npy shards of shape (N, H, W, 3) uint8, next to
+a manifest.json recording each image's label, split, source path, content hash
+and location. Later runs memory-map the shards instead of decoding JPEG/PNG
+again, and a rebuild only decodes files that are new or whose hash changed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from augmentation import build_augmenter  # noqa: E402
+from data_preprocessing import CLASSES, get_data_path, list_image_files, split_file_list  # noqa: E402
+from preprocessing import decode_uint8  # noqa: E402
+
+MANIFEST = "manifest.json"
+SPLITS = ("train", "val", "test")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _hash_if_changed(path, previous):
+    # Size and mtime unchanged: trust the stored hash instead of re-reading the file
+    stat = os.stat(path)
+    if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+        return previous["sha256"], stat
+    return file_sha256(path), stat
+
+
+def build_shards(data_path, output_dir, image_size=(128, 128), shard_size=4096, max_images_per_class=None,
+                 workers=8):
+    """
+    Creates or updates the shard cache in `output_dir` and returns the manifest.
+
+    Images whose content hash is unchanged keep their shard slot and split.
+    Changed images keep their split and are decoded again into new shards.
+    New images are decoded and assigned a split (stratified, with the same
+    proportions as `load_Preprcess_data`).
+    A different `image_size` forces a full rebuild.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    if manifest is not None and tuple(manifest["image_size"]) != tuple(image_size):
+        manifest = None
+    previous = {e["path"]: e for e in manifest["entries"]} if manifest else {}
+    next_shard = max((e["shard"] for e in previous.values()), default=-1) + 1
+
+    paths, labels = list_image_files(data_path, max_images_per_class)
+    kept, todo = [], []
+    for path, label in tqdm(zip(paths, labels), total=len(paths), desc="Hashing images"):
+        old = previous.get(path)
+        sha256, stat = _hash_if_changed(path, old)
+        entry = {"path": str(path), "label": int(label), "sha256": sha256,
+                 "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if old is not None and old["sha256"] == sha256:
+            kept.append({**entry, "split": old["split"], "shard": old["shard"], "index": old["index"]})
+        elif old is not None:
+            # An edited file stays in its split, so a test image never leaks into train
+            todo.append({**entry, "split": old["split"]})
+        else:
+            todo.append(entry)
+
+    # Only new files get a split, so existing assignments never move
+    new = [e for e in todo if "split" not in e]
+    if new:
+        new_paths = np.array([e["path"] for e in new])
+        new_labels = np.array([e["label"] for e in new])
+        if len(new) >= 12 and min(np.bincount(new_labels, minlength=len(CLASSES))) >= 3:
+            splits = split_file_list(new_paths, new_labels)
+            assigned = {p: name for name, (split_paths, _) in zip(SPLITS, splits) for p in split_paths}
+        else:
+            assigned = {p: "train" for p in new_paths}
+        for entry in new:
+            entry["split"] = assigned[entry["path"]]
+
+    # Write changed images into new shards, one sequence of shards per split
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for split in SPLITS:
+            entries = [e for e in todo if e["split"] == split]
+            for start in range(0, len(entries), shard_size):
+                chunk = entries[start:start + shard_size]
+                shard_path = os.path.join(output_dir, f"shard_{next_shard:05d}.npy")
+                shard = np.lib.format.open_memmap(
+                    shard_path, mode="w+", dtype=np.uint8, shape=(len(chunk), *image_size, 3))
+                images = executor.map(lambda e: decode_uint8(e["path"], image_size), chunk)
+                for i, (entry, image) in enumerate(tqdm(zip(chunk, images), total=len(chunk),
+                                                        desc=f"Writing {split} shard {next_shard}")):
+                    shard[i] = image
+                    entry["shard"], entry["index"] = next_shard, i
+                shard.flush()
+                del shard
+                next_shard += 1
+
+    manifest = {"image_size": list(image_size), "entries": kept + todo}
+    with open(os.path.join(output_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+    # Shards nobody points to any more can go
+    used = {e["shard"] for e in manifest["entries"]}
+    for name in os.listdir(output_dir):
+        if name.startswith("shard_") and name.endswith(".npy") and int(name[6:11]) not in used:
+            os.remove(os.path.join(output_dir, name))
+    return manifest
+
+
+def load_split(output_dir, split):
+    """
+    Memory-maps the shards of one split without copying. Returns a list of
+    (uint8 images, labels) pairs, one per shard. Images are read-only views,
+    unless the split's slots in a shard are not contiguous, in which case they
+    are gathered into a copy.
+    """
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No {MANIFEST} in {output_dir}; run shard_cache.py first.")
+
+    by_shard = {}
+    for entry in manifest["entries"]:
+        if entry["split"] == split:
+            by_shard.setdefault(entry["shard"], []).append((entry["index"], entry["label"]))
+
+    parts = []
+    for shard_id, items in sorted(by_shard.items()):
+        items.sort()
+        indices = np.array([i for i, _ in items])
+        labels = np.array([label for _, label in items])
+        shard = np.load(os.path.join(output_dir, f"shard_{shard_id:05d}.npy"), mmap_mode="r")
+        if indices[-1] - indices[0] + 1 == len(indices):
+            images = shard[indices[0]:indices[-1] + 1]
+        else:
+            images = shard[indices]
+        parts.append((images, labels))
+    return parts
+
+
+def load_split_arrays(output_dir, split):
+    """Whole split as one (uint8 images, one-hot labels) pair, like `load_Preprcess_data` but 8x smaller than float64."""
+    parts = load_split(output_dir, split)
+    images = np.concatenate([images for images, _ in parts])
+    labels = np.concatenate([labels for _, labels in parts])
+    return images, np.eye(len(CLASSES), dtype=np.float32)[labels]
+
+
+def make_shard_dataset(output_dir, split, batch_size=32, training=False, augment=True, seed=42):
+    """
+    tf.data pipeline reading batches straight from the memory-mapped shards.
+    Yields (float32 images in [0, 1], one-hot labels); training data is
+    reshuffled every epoch and augmented on the fly.
+    """
+    parts = load_split(output_dir, split)
+    offsets = np.cumsum([0] + [len(labels) for _, labels in parts])
+    total = int(offsets[-1])
+    image_shape = parts[0][0].shape[1:]
+
+    def generate():
+        order = np.random.default_rng(seed + generate.epoch).permutation(total) if training else np.arange(total)
+        generate.epoch += 1
+        for start in range(0, total, batch_size):
+            # Sort each batch so reads from the memmap stay as sequential as possible
+            batch = np.sort(order[start:start + batch_size])
+            shard_ids = np.searchsorted(offsets, batch, side="right") - 1
+            images = np.empty((len(batch), *image_shape), dtype=np.uint8)
+            labels = np.empty(len(batch), dtype=np.int64)
+            for shard_id in np.unique(shard_ids):
+                mask = shard_ids == shard_id
+                local = batch[mask] - offsets[shard_id]
+                images[mask] = parts[shard_id][0][local]
+                labels[mask] = parts[shard_id][1][local]
+            yield images, labels
+    generate.epoch = 0
+
+    ds = tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(
+            tf.TensorSpec((None, *image_shape), tf.uint8),
+            tf.TensorSpec((None,), tf.int64),
+        ),
+    )
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, tf.one_hot(y, len(CLASSES))),
+                num_parallel_calls=tf.data.AUTOTUNE)
+    if training and augment:
+        augmenter = build_augmenter()
+        ds = ds.map(lambda x, y: (augmenter(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("loading_method", choices=["colab", "direct"])
+    parser.add_argument("--output", default="data_cache")
+    parser.add_argument("--image-size", type=int, default=128)
+    parser.add_argument("--shard-size", type=int, default=4096)
+    parser.add_argument("--max-images-per-class", type=int, default=None)
+    args = parser.parse_args()
+
+    manifest = build_shards(
+        get_data_path(args.loading_method), args.output,
+        image_size=(args.image_size, args.image_size),
+        shard_size=args.shard_size,
+        max_images_per_class=args.max_images_per_class,
+    )
+    counts = {split: sum(e["split"] == split for e in manifest["entries"]) for split in SPLITS}
+    print(f"{len(manifest['entries'])} images cached in {args.output}: {counts}")
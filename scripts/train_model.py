@@ -1,18 +1,138 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import tensorflow as tf
 from tensorflow.keras.applications import VGG16
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, Dropout, GlobalAveragePooling2D, Input, BatchNormalization
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.metrics import Precision, Recall
-from tensorflow.keras.callbacks import ModelCheckpoint, ReduceLROnPlateau, EarlyStopping
+from tensorflow.keras.callbacks import Callback, ModelCheckpoint, ReduceLROnPlateau, EarlyStopping
 
 # Constants
 IMG_SIZE = 128
 LEARNING_RATE = 0.00001
 
-def build_vgg16_model_unfreeze_2(img_size=IMG_SIZE, learning_rate=LEARNING_RATE):
+
+class TrainingConfig:
+    """
+    Performance settings for `train_model`.
+
+    xla : compile the training step with XLA (`jit_compile=True`).
+    mixed_precision : compute in bfloat16 and keep float32 weights. Only applied
+        on CPUs with native bfloat16 (AVX512-BF16 or AMX) or on a GPU; elsewhere
+        it would be slower than float32.
+    intra_op_threads, inter_op_threads : TensorFlow thread pool sizes (None
+        keeps TensorFlow's defaults).
+    batch_size : batch size per worker.
+    """
+
+    def __init__(self, batch_size=32, xla=False, mixed_precision=False, intra_op_threads=None,
+                 inter_op_threads=None):
+        self.batch_size = batch_size
+        self.xla = xla
+        self.mixed_precision = mixed_precision
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def apply(self):
+        """Sets the thread pools and precision policy; call before TensorFlow runs any op."""
+        try:
+            if self.intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        except RuntimeError:
+            print("TensorFlow is already initialized; keeping its thread pool sizes")
+        if self.mixed_precision and not (supports_bfloat16() or tf.config.list_physical_devices("GPU")):
+            print("This CPU has no native bfloat16 support; training in float32")
+            self.mixed_precision = False
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16" if self.mixed_precision else "float32")
+
+
+def supports_bfloat16():
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line for line in f if line.startswith("flags")), "").split()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+class ThroughputLogger(Callback):
+    """Prints each epoch's wall time and training images/sec, and adds both to the history."""
+
+    def __init__(self, images_per_epoch=None, batch_size=None):
+        super().__init__()
+        self.images_per_epoch = images_per_epoch
+        self.batch_size = batch_size
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = self.train_end = time.perf_counter()
+        self.steps = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        self.train_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # For batched datasets the count is steps x batch size, so the last partial batch is rounded up
+        images = self.images_per_epoch or self.steps * self.batch_size
+        rate = images / max(self.train_end - self.start, 1e-9)
+        seconds = time.perf_counter() - self.start
+        print(f"Epoch {epoch + 1}: {seconds:.1f}s, {rate:.1f} images/sec")
+        if logs is not None:
+            logs["epoch_seconds"] = seconds
+            logs["images_per_sec"] = rate
+
+
+def make_strategy():
+    """
+    MultiWorkerMirroredStrategy when this process is one worker of a cluster
+    (TF_CONFIG is set, e.g. by `launch_local_workers`), else None. Like
+    `TrainingConfig.apply`, call it before TensorFlow runs any op.
+    """
+    if "TF_CONFIG" not in os.environ:
+        return None
+    return tf.distribute.MultiWorkerMirroredStrategy()
+
+
+def is_chief():
+    task = json.loads(os.environ.get("TF_CONFIG", "{}")).get("task", {})
+    return task.get("index", 0) == 0
+
+
+def launch_local_workers(num_workers, argv):
+    """
+    Runs this script `num_workers` times on this machine, as one
+    MultiWorkerMirroredStrategy cluster. Returns the first non-zero exit code.
+    """
+    ports = []
+    for _ in range(num_workers):
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            ports.append(s.getsockname()[1])
+    cluster = {"worker": [f"localhost:{port}" for port in ports]}
+
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ, TF_CONFIG=json.dumps({"cluster": cluster, "task": {"type": "worker", "index": index}}))
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv], env=env))
+    codes = [process.wait() for process in processes]
+    return next((code for code in codes if code), 0)
+
+
+def build_vgg16_model_unfreeze_2(img_size=IMG_SIZE, learning_rate=LEARNING_RATE, weights='imagenet',
+                                 jit_compile=False):
     base_model = VGG16(
         include_top=False,
-        weights='imagenet',
+        weights=weights,
         input_tensor=Input(shape=(img_size, img_size, 3))
     )
 
@@ -23,7 +143,14 @@ def build_vgg16_model_unfreeze_2(img_size=IMG_SIZE, learning_rate=LEARNING_RATE)
         if 'block5' in layer.name:
             layer.trainable = True
 
-    x = base_model.output
+    output = add_classifier_head(base_model.output)
+
+    model = Model(inputs=base_model.input, outputs=output)
+    compile_classifier(model, learning_rate, jit_compile)
+    return model
+
+def add_classifier_head(x):
+    """The dense classifier on top of block5; also used by feature_cache.py."""
     x = GlobalAveragePooling2D()(x)
     x = Dense(256, activation='relu')(x)
     x = BatchNormalization()(x)
@@ -32,31 +159,175 @@ def build_vgg16_model_unfreeze_2(img_size=IMG_SIZE, learning_rate=LEARNING_RATE)
     x = Dropout(0.3)(x)
     x = Dense(64, activation='relu')(x)
     x = Dropout(0.2)(x)
-    output = Dense(2, activation='softmax')(x)
+    # Softmax in float32 even under a mixed precision policy
+    return Dense(2, activation='softmax', dtype='float32')(x)
 
-    model = Model(inputs=base_model.input, outputs=output)
+def compile_classifier(model, learning_rate=LEARNING_RATE, jit_compile=False):
     model.compile(
         optimizer=Adam(learning_rate=learning_rate),
         loss='categorical_crossentropy',
-        metrics=['accuracy', Precision(name="precision"), Recall(name='recall')]
+        metrics=['accuracy', Precision(name="precision"), Recall(name='recall')],
+        jit_compile=jit_compile
     )
-    return model
 
-def train_model(X_train, y_train, X_val, y_val, output_path="best_model.keras"):
-    model = build_vgg16_model_unfreeze_2()
+def train_model(X_train, y_train=None, X_val=None, y_val=None, output_path="best_model.keras", epochs=30,
+                weights='imagenet', config=None, strategy=None):
+    """
+    Trains the VGG16 model on in-memory arrays, or on the batched tf.data
+    datasets from `data_preprocessing.load_datasets`: pass the training dataset
+    as `X_train` and the validation dataset as `X_val`, leaving the labels None.
+    A training dataset can also be combined with validation arrays.
+    `weights=None` starts from random weights instead of downloading ImageNet's.
+
+    `config` is a `TrainingConfig`, already applied. With a `strategy` from
+    `make_strategy`, datasets must be batched with the global batch size
+    (config.batch_size x number of workers); arrays are batched here.
+    """
+    config = config or TrainingConfig()
+    if strategy is not None:
+        global_batch = config.batch_size * strategy.num_replicas_in_sync
+        num_images = None if isinstance(X_train, tf.data.Dataset) else len(X_train)
+        if not isinstance(X_train, tf.data.Dataset):
+            X_train = tf.data.Dataset.from_tensor_slices((X_train, y_train)).batch(global_batch)
+        if y_val is not None:
+            X_val = tf.data.Dataset.from_tensor_slices((X_val, y_val)).batch(global_batch)
+        # Shard by batch, not by file: the datasets are built from one file list
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+        X_train, X_val = X_train.with_options(options), X_val.with_options(options)
+        with strategy.scope():
+            model = build_vgg16_model_unfreeze_2(weights=weights, jit_compile=config.xla)
+        if not is_chief():
+            # Every worker must save, but only the chief's checkpoint is kept
+            output_path = os.path.join(tempfile.mkdtemp(), os.path.basename(output_path))
+    else:
+        global_batch = config.batch_size
+        model = build_vgg16_model_unfreeze_2(weights=weights, jit_compile=config.xla)
 
     callbacks = [
         ModelCheckpoint(output_path, save_best_only=True, monitor='val_loss', mode='min'),
         ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, verbose=1),
-        EarlyStopping(monitor='val_loss', patience=6, restore_best_weights=True)
+        EarlyStopping(monitor='val_loss', patience=6, restore_best_weights=True),
+        ThroughputLogger(None if isinstance(X_train, tf.data.Dataset) else len(X_train), global_batch),
     ]
 
-    history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
-        epochs=30,
-        batch_size=32,
-        callbacks=callbacks
-    )
+    if strategy is not None:
+        callbacks[-1].images_per_epoch = num_images
+        history = _fit_distributed(model, strategy, X_train, X_val, epochs, callbacks, config.xla)
+    elif isinstance(X_train, tf.data.Dataset):
+        # Datasets are already batched and carry their labels
+        history = model.fit(
+            X_train,
+            validation_data=X_val if y_val is None else (X_val, y_val),
+            epochs=epochs,
+            callbacks=callbacks
+        )
+    else:
+        history = model.fit(
+            X_train, y_train,
+            validation_data=(X_val, y_val),
+            epochs=epochs,
+            batch_size=config.batch_size,
+            callbacks=callbacks
+        )
 
     return model, history
+
+
+def _fit_distributed(model, strategy, train_ds, val_ds, epochs, callbacks, jit_compile=False):
+    """
+    Training loop for MultiWorkerMirroredStrategy, which Keras 3's `fit` does
+    not support. Drives the same callbacks and logs the same metrics as `fit`.
+    """
+    loss_fn = tf.keras.losses.CategoricalCrossentropy(reduction=None)
+    with strategy.scope():
+        metrics = {
+            "loss": tf.keras.metrics.Mean(),
+            "accuracy": tf.keras.metrics.CategoricalAccuracy(),
+            "precision": Precision(),
+            "recall": Recall(),
+        }
+
+    def update_metrics(labels, predictions, per_example_loss):
+        metrics["loss"].update_state(per_example_loss)
+        for name in ("accuracy", "precision", "recall"):
+            metrics[name].update_state(labels, predictions)
+
+    @tf.function(jit_compile=jit_compile)
+    def forward_backward(images, labels):
+        with tf.GradientTape() as tape:
+            predictions = model(images, training=True)
+            per_example_loss = loss_fn(labels, predictions)
+            loss = tf.nn.compute_average_loss(per_example_loss)
+        return tape.gradient(loss, model.trainable_variables), predictions, per_example_loss
+
+    def train_step(images, labels):
+        # Gradients are all-reduced across workers inside apply_gradients
+        gradients, predictions, per_example_loss = forward_backward(images, labels)
+        model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        update_metrics(labels, predictions, per_example_loss)
+
+    def test_step(images, labels):
+        predictions = model(images, training=False)
+        update_metrics(labels, predictions, loss_fn(labels, predictions))
+
+    train_fn = tf.function(lambda batch: strategy.run(train_step, args=batch))
+    test_fn = tf.function(lambda batch: strategy.run(test_step, args=batch))
+
+    def run_epoch(step_fn, dataset, on_batch_end=None):
+        for metric in metrics.values():
+            metric.reset_state()
+        for step, batch in enumerate(strategy.experimental_distribute_dataset(dataset)):
+            step_fn(batch)
+            if on_batch_end is not None:
+                on_batch_end(step)
+        return {name: float(metric.result()) for name, metric in metrics.items()}
+
+    callback_list = tf.keras.callbacks.CallbackList(callbacks, add_history=True, model=model)
+    model.stop_training = False
+    callback_list.on_train_begin()
+    for epoch in range(epochs):
+        callback_list.on_epoch_begin(epoch)
+        logs = run_epoch(train_fn, train_ds, callback_list.on_train_batch_end)
+        logs.update({f"val_{name}": value for name, value in run_epoch(test_fn, val_ds).items()})
+        print(" - ".join(f"{name}: {value:.4f}" for name, value in logs.items()))
+        callback_list.on_epoch_end(epoch, logs)
+        if model.stop_training:
+            break
+    callback_list.on_train_end()
+    return model.history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tunes VGG16 on the BreaKHis folders and logs epoch throughput.")
+    parser.add_argument("loading_method", choices=["colab", "direct"])
+    parser.add_argument("--output", default="best_model.keras")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=32, help="Per-worker batch size")
+    parser.add_argument("--max-images-per-class", type=int, default=None)
+    parser.add_argument("--xla", action="store_true", help="Compile the training step with XLA")
+    parser.add_argument("--mixed-precision", action="store_true", help="bfloat16 compute, if the CPU supports it")
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="Local processes for MultiWorkerMirroredStrategy")
+    parser.add_argument("--random-init", action="store_true",
+                        help="Random instead of ImageNet weights, e.g. to compare setups offline")
+    args = parser.parse_args()
+
+    if args.workers > 1 and "TF_CONFIG" not in os.environ:
+        sys.exit(launch_local_workers(args.workers, sys.argv[1:]))
+
+    # Split the cores between local workers unless told otherwise
+    intra_op_threads = args.intra_op_threads or (max(1, os.cpu_count() // args.workers) if args.workers > 1 else None)
+    config = TrainingConfig(args.batch_size, args.xla, args.mixed_precision, intra_op_threads, args.inter_op_threads)
+    config.apply()
+    strategy = make_strategy()
+
+    from data_preprocessing import load_datasets
+    num_workers = strategy.num_replicas_in_sync if strategy is not None else 1
+    train_ds, val_ds, _, _ = load_datasets(args.loading_method, batch_size=args.batch_size * num_workers,
+                                           max_images_per_class=args.max_images_per_class)
+    model, history = train_model(train_ds, X_val=val_ds, output_path=args.output, epochs=args.epochs,
+                                 weights=None if args.random_init else 'imagenet', config=config, strategy=strategy)
+    rates = history.history["images_per_sec"]
+    print(f"Mean {sum(rates) / len(rates):.1f} images/sec over {len(rates)} epochs")
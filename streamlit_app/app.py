@@ -2,20 +2,53 @@ import streamlit as st
 from PIL import Image
 import os
 from dotenv import load_dotenv
-from utils.api import send_image_for_prediction
+from utils.api import get_serving_version, send_image_for_prediction
 import base64
+import hashlib
 
+# Assets are read and encoded once per process, not on every rerun
+@st.cache_data(show_spinner=False)
 def get_base64_image(path):
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode()
 
+@st.cache_data(show_spinner=False)
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+class PredictionError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Error {status_code}")
+        self.status_code = status_code
+
+# Re-checked often, so a promotion or rollback reaches the prediction cache key within seconds
+@st.cache_data(show_spinner=False, ttl=10)
+def serving_version(api_url):
+    return get_serving_version(api_url)
+
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
+def predict_cached(api_url, file_hash, model_version, _uploaded_file):
+    """
+    Prediction for one image, cached by the SHA-256 of its bytes and the
+    model version serving it: reruns and re-uploads of the same image never
+    reach the backend, until another model is promoted. Failures raise, so
+    they are not cached.
+    """
+    response = send_image_for_prediction(api_url, _uploaded_file)
+    if isinstance(response, Exception):
+        raise response
+    if response.status_code != 200:
+        raise PredictionError(response.status_code)
+    return response.json()
+
 dna_base64 = get_base64_image("assets/background/dna.png")
 microscope_base64 = get_base64_image("assets/background/microscope.png")
 beaker_base64 = get_base64_image("assets/background/beaker.png")
 logo_base64 = get_base64_image("assets/background/logo-2.png")
 
 def render_member(member):
-    img_base64 = base64.b64encode(open(member['image'], "rb").read()).decode()
+    img_base64 = get_base64_image(member['image'])
     return f"""
         <div class="team-card">
             <img src="data:image/jpeg;base64,{img_base64}" class="team-img">
@@ -26,8 +59,7 @@ def render_member(member):
 
 # Load CSS
 def load_css():
-    with open("styles/style.css") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    st.markdown(f"<style>{read_text('styles/style.css')}</style>", unsafe_allow_html=True)
 # App setup
 
 if "uploaded_file" not in st.session_state:
@@ -114,19 +146,18 @@ else:
         if st.button("🔍 Predict"):
             with st.spinner("🧬 Analyzing the image..."):
                 API_URL = os.getenv("API_URL")
-                response = send_image_for_prediction(API_URL, uploaded_file)
-
-                if isinstance(response, Exception):
+                file_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+                try:
+                    result = predict_cached(API_URL, file_hash, serving_version(API_URL), uploaded_file)
+                except PredictionError as e:
                     with col02:
-                        st.error(f"🚨 API Error: {response}")
-                elif response.status_code == 200:
+                        st.error(f"❌ Error {e.status_code}: Could not get prediction.")
+                except Exception as e:
                     with col02:
-                        result = response.json()
-                        st.session_state.prediction_result = result
-                        st.rerun()
+                        st.error(f"🚨 API Error: {e}")
                 else:
-                    with col02:
-                        st.error(f"❌ Error {response.status_code}: Could not get prediction.")
+                    st.session_state.prediction_result = result
+                    st.rerun()
     else:
         # ✅ Show Result
         with col02:
@@ -195,8 +226,7 @@ with col2:
 
 
 if st.session_state.get("show_project_info", False):
-    with open("assets/project_info.md", "r") as md_file:
-        md_content = md_file.read()
+    md_content = read_text("assets/project_info.md")
 
     st.markdown("<h3 style='text-align:center; color:#8B004D;'>Project Overview</h3>", unsafe_allow_html=True)
 
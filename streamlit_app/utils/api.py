@@ -1,9 +1,87 @@
+import json
+import os
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds; a cold backend can take a while to answer
+TIMEOUT = (float(os.getenv("API_CONNECT_TIMEOUT", "5")), float(os.getenv("API_READ_TIMEOUT", "60")))
+# Retries on connection errors and on 502/503/504 (e.g. while the model is loading)
+RETRIES = int(os.getenv("API_RETRIES", "3"))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    One keep-alive session per process, shared by every Streamlit session.
+
+    Predictions are idempotent, so POSTs are retried too, with backoff and
+    honouring the backend's Retry-After header.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET", "POST"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def get_serving_version(api_url):
+    """
+    Tag for the model(s) currently answering /predict: the primary, plus the
+    A/B candidate and its share while one takes traffic. None if the backend
+    cannot be asked.
+    """
+    try:
+        response = get_session().get(f"{api_url}/models", timeout=TIMEOUT)
+        response.raise_for_status()
+        routing = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    version = routing["primary"]
+    if routing.get("candidate") and routing.get("mode") == "ab" and routing.get("candidate_percent"):
+        version += f"+{routing['candidate']}@{routing['candidate_percent']}"
+    return version
 
 def send_image_for_prediction(api_url, uploaded_file):
     try:
         files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-        response = requests.post(f"{api_url}/predict", files=files)
+        response = get_session().post(f"{api_url}/predict", files=files, timeout=TIMEOUT)
         return response
     except Exception as e:
         return e
+
+def send_images_for_prediction(api_url, uploaded_files=None, archive=None):
+    """
+    Sends many images (or one ZIP/tar archive) to /predict/batch.
+
+    Returns the streaming response, or the exception on failure. Use
+    `iter_batch_predictions` to read results as the backend produces them.
+    """
+    try:
+        if archive is not None:
+            files = {"archive": (archive.name, archive.getvalue(), archive.type)}
+        else:
+            files = [("files", (f.name, f.getvalue(), f.type)) for f in uploaded_files]
+        response = get_session().post(f"{api_url}/predict/batch", files=files, stream=True, timeout=TIMEOUT)
+        return response
+    except Exception as e:
+        return e
+
+def iter_batch_predictions(response):
+    # One JSON object per line; the last line is a {"summary": ...} record
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)